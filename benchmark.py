@@ -0,0 +1,257 @@
+"""Offline throughput benchmark: python benchmark.py --tracks 100 1000 [options]
+
+Drives the real fetch -> resolve -> download -> lyrics -> embed pipeline of DownloaderCore against local
+stand-ins: a fake Spotify paging API, a fake search backend, a fake Genius and a local HTTP server that
+serves a generated WAV file for every "video". yt-dlp downloads from that server and ffmpeg transcodes
+as usual (if ffmpeg is not on PATH, transcoding is replaced by a file copy and the report says so).
+No network access is needed.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeServiceError(Exception):
+    """Looks like a throttled HTTP response to the rate limiter."""
+    def __init__(self, status=429):
+        super().__init__(f"fake service returned {status}")
+        self.http_status = status
+        self.headers = {}
+
+
+class FakeService:
+    def __init__(self, latency, failure_rate, rng):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng
+
+    def simulate(self):
+        if self.latency:
+            time.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        if self.rng.random() < self.failure_rate:
+            raise FakeServiceError(self.rng.choice((429, 503)))
+
+
+class FakeSpotify(FakeService):
+    """Serves a synthetic playlist in spotipy's paging format."""
+    def __init__(self, num_tracks, latency, failure_rate, rng):
+        super().__init__(latency, failure_rate, rng)
+        self.tracks = [{
+            'id': f"track{i:06d}",
+            'name': f"Song {i}",
+            'artists': [{'name': f"Artist {i % 97}"}],
+            'album': {'name': f"Album {i % 31}"},
+            'duration_ms': 180000 + (i % 20) * 1000,
+            'external_ids': {'isrc': f"XX{i:010d}"},
+        } for i in range(num_tracks)]
+
+    def _page(self, offset, limit=100):
+        items = [{'track': t} for t in self.tracks[offset:offset + limit]]
+        next_offset = offset + limit if offset + limit < len(self.tracks) else None
+        return {'items': items, 'total': len(self.tracks), 'offset': offset, 'limit': limit, 'next': next_offset}
+
+    def playlist(self, playlist_id, fields=None, **kwargs):
+        self.simulate()
+        return {'snapshot_id': 'benchmark', 'tracks': {'total': len(self.tracks)}}
+
+    def playlist_tracks(self, playlist_id, fields=None, limit=100, offset=0, **kwargs):
+        self.simulate()
+        return self._page(offset, limit)
+
+    playlist_items = playlist_tracks
+
+    def next(self, result):
+        self.simulate()
+        return self._page(result['next'], result['limit']) if result['next'] is not None else None
+
+
+class FakeSearch(FakeService):
+    """Stands in for the YouTube search backend, pointing every result at the local media server."""
+    def __init__(self, media_url, latency, failure_rate, rng):
+        super().__init__(latency, failure_rate, rng)
+        self.media_url = media_url
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, query, max_results):
+        self.simulate()
+        with self.lock:
+            self.counter += 1
+            video_id = self.counter
+        # The top hit is an hour-long loop, as real searches often return; ranking has to skip it
+        return [{'id': f"v{video_id}-{n}", 'title': f"{query} 1 hour loop" if n == 0 else query,
+                 'channel': 'Benchmark' if n == 0 else 'Benchmark - Topic', 'duration': '1:00:00' if n == 0 else '3:05',
+                 'url': f"{self.media_url}/audio/v{video_id}-{n}.wav"} for n in range(max_results)]
+
+
+class FakeGenius(FakeService):
+    def search_song(self, title, artist):
+        self.simulate()
+        if self.rng.random() < 0.1:
+            return None
+        return type('Song', (), {'lyrics': f"{title} Lyrics\n" + "\n".join(f"line {n}" for n in range(40))})()
+
+
+def make_wav(seconds, rate=8000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b'\x00\x00' * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def start_media_server(payload, latency, failure_rate, rng):
+    """Serves `payload` at /audio/<anything>.wav, with Range support, on a random local port."""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_HEAD(self):
+            self.send_payload(head=True)
+
+        def do_GET(self):
+            self.send_payload(head=False)
+
+        def send_payload(self, head):
+            if latency:
+                time.sleep(latency * rng.uniform(0.5, 1.5))
+            if rng.random() < failure_rate:
+                self.send_error(503)
+                return
+            start, end = 0, len(payload) - 1
+            match = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+            if match and match.group(1):
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else end
+            self.send_response(206 if match else 200)
+            self.send_header('Content-Type', 'audio/wav')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            if match:
+                self.send_header('Content-Range', f"bytes {start}-{end}/{len(payload)}")
+            self.end_headers()
+            if not head:
+                self.wfile.write(payload[start:end + 1])
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process, so each playlist size is run in a process of its own."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def run_benchmark(num_tracks, args, media_url, workdir):
+    import core
+    rng = random.Random(args.seed)
+    run_dir = os.path.join(workdir, f"run-{num_tracks}")
+    os.makedirs(run_dir)
+    # The core keeps its caches next to config.ini in the working directory; start each size cold
+    os.chdir(run_dir)
+    dl = core.DownloaderCore(log=(print if args.verbose else lambda message: None))
+    dl.download_dir = os.path.join(run_dir, 'downloads')
+    dl.sp = FakeSpotify(num_tracks, args.spotify_latency, args.failure_rate, rng)
+    dl.genius = FakeGenius(args.genius_latency, args.failure_rate, rng)
+    dl.search_backend = FakeSearch(media_url, args.search_latency, args.failure_rate, rng)
+    dl.sync_enabled = False
+    dl.limiter.base_delay = args.backoff
+    for bucket in dl.limiter.buckets.values():
+        bucket.rate = bucket.capacity = args.rate
+        bucket.tokens = args.rate
+    transcoder = 'ffmpeg'
+    if not shutil.which(core.FFMPEG_EXE_PATH):
+        transcoder = 'copy (ffmpeg not found)'
+        dl.transcode = lambda source, target, copy=False: os.replace(source, target)
+
+    start = time.perf_counter()
+    dl.run('https://open.spotify.com/playlist/benchmark')
+    elapsed = time.perf_counter() - start
+    report = dl.metrics.report(dl.downloaded_tracks, dl.total_tracks)
+    return {
+        'tracks': num_tracks,
+        'processed': dl.downloaded_tracks,
+        'failed': dl.failed_tracks,
+        'seconds': round(elapsed, 3),
+        'tracks_per_second': round(dl.downloaded_tracks / elapsed, 3) if elapsed else None,
+        'peak_memory_mb': peak_memory_mb(),
+        'transcoder': transcoder,
+        'stages': {name: {k: stats[k] for k in ('count', 'failures', 'retries', 'mean_seconds', 'max_seconds')}
+                   for name, stats in report['stages'].items()},
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the download pipeline against local stand-ins.")
+    parser.add_argument('--tracks', type=int, nargs='+', default=[100, 1000], help="playlist sizes to run (default: 100 1000)")
+    parser.add_argument('--spotify-latency', type=float, default=0.05, help="mean seconds per Spotify page")
+    parser.add_argument('--search-latency', type=float, default=0.3, help="mean seconds per search")
+    parser.add_argument('--genius-latency', type=float, default=0.5, help="mean seconds per Genius lookup")
+    parser.add_argument('--media-latency', type=float, default=0.05, help="mean seconds before each media response")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="probability that any fake call fails with 429/503")
+    parser.add_argument('--audio-seconds', type=float, default=5, help="length of the served WAV file")
+    parser.add_argument('--rate', type=float, default=1000, help="requests/second allowed per service by the rate limiter")
+    parser.add_argument('--backoff', type=float, default=0.05, help="base retry backoff in seconds")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--keep', action='store_true', help="keep the temporary working directory")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print the pipeline's log lines")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    rng = random.Random(args.seed)
+    json_path = os.path.abspath(args.json) if args.json else None
+    server = start_media_server(make_wav(args.audio_seconds), args.media_latency, args.failure_rate, rng)
+    media_url = f"http://127.0.0.1:{server.server_address[1]}"
+    workdir = tempfile.mkdtemp(prefix='spotitube-bench-')
+    cwd = os.getcwd()
+    results = []
+    try:
+        # A fresh process per size: ru_maxrss never goes down, so a shared one would report the largest peak so far
+        context = multiprocessing.get_context('spawn')
+        for num_tracks in args.tracks:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_benchmark, (num_tracks, args, media_url, workdir))
+            results.append(result)
+            print(f"{result['tracks']:>6} tracks: {result['seconds']:>8.2f}s  {result['tracks_per_second']:>7.2f} tracks/s  "
+                  f"{result['failed']} failed  peak {result['peak_memory_mb'] or 0:.0f} MB  transcode: {result['transcoder']}")
+            for name, stats in result['stages'].items():
+                print(f"         {name:<10} n={stats['count']:<6} mean={stats['mean_seconds']:.3f}s  max={stats['max_seconds']:.3f}s  "
+                      f"retries={stats['retries']}  failures={stats['failures']}")
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
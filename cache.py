@@ -0,0 +1,127 @@
+import sqlite3
+import threading
+import time
+
+
+class ResolutionCache:
+    """On-disk cache of Spotify track ID -> chosen YouTube video, with TTL expiry and LRU eviction."""
+
+    def __init__(self, path, ttl_seconds=30 * 24 * 3600, max_entries=50000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS resolutions ("
+                "track_id TEXT PRIMARY KEY, youtube_url TEXT NOT NULL, duration INTEGER, "
+                "resolved_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_resolutions_last_used ON resolutions (last_used)")
+
+    def get(self, track_id):
+        """Returns {'youtube_url', 'duration', 'resolved_at'} for a fresh entry, or None."""
+        if not track_id:
+            return None
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT youtube_url, duration, resolved_at FROM resolutions WHERE track_id = ?", (track_id,)
+            ).fetchone()
+            if not row:
+                return None
+            if self.ttl_seconds and now - row[2] > self.ttl_seconds:
+                self.conn.execute("DELETE FROM resolutions WHERE track_id = ?", (track_id,))
+                return None
+            self.conn.execute("UPDATE resolutions SET last_used = ? WHERE track_id = ?", (now, track_id))
+        return {'youtube_url': row[0], 'duration': row[1], 'resolved_at': row[2]}
+
+    def put(self, track_id, youtube_url, duration=None):
+        if not track_id:
+            return
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO resolutions (track_id, youtube_url, duration, resolved_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (track_id, youtube_url, duration, now, now),
+            )
+            self._evict()
+
+    def invalidate(self, track_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM resolutions WHERE track_id = ?", (track_id,))
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM resolutions")
+
+    def _evict(self):
+        if not self.max_entries:
+            return
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM resolutions").fetchone()
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM resolutions WHERE track_id IN "
+                "(SELECT track_id FROM resolutions ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class LyricsCache:
+    """On-disk cache of Genius lookups. Misses are stored too, with a shorter TTL, so they are retried sooner."""
+
+    def __init__(self, path, ttl_seconds=90 * 24 * 3600, negative_ttl_seconds=3 * 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS lyrics (key TEXT PRIMARY KEY, lyrics TEXT, fetched_at REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        """Returns (found, lyrics). lyrics is None for a cached "no lyrics found" result."""
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT lyrics, fetched_at FROM lyrics WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return False, None
+            ttl = self.ttl_seconds if row[0] is not None else self.negative_ttl_seconds
+            if ttl and time.time() - row[1] > ttl:
+                self.conn.execute("DELETE FROM lyrics WHERE key = ?", (key,))
+                return False, None
+        return True, row[0]
+
+    def put(self, key, lyrics):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO lyrics (key, lyrics, fetched_at) VALUES (?, ?, ?)", (key, lyrics, time.time())
+            )
+
+    def invalidate(self, key):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM lyrics WHERE key = ?", (key,))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def parse_duration(text):
+    """Converts a YouTube duration string like '1:02:03' or '3:45' to seconds."""
+    if not text:
+        return None
+    try:
+        seconds = 0
+        for part in str(text).split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    except ValueError:
+        return None
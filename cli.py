@@ -0,0 +1,98 @@
+"""Headless entry point: python cli.py PLAYLIST_URL [PLAYLIST_URL ...] [options]"""
+import argparse
+import sys
+
+
+def read_playlist_links(args):
+    links = list(args.urls)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            links.extend(line.strip() for line in f if line.strip() and not line.strip().startswith('#'))
+    return links
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Download Spotify playlists as MP3s from YouTube, with lyrics.")
+    parser.add_argument('urls', nargs='*', help="Spotify playlist, album or artist URLs")
+    parser.add_argument('-f', '--file', help="file with one playlist URL per line")
+    parser.add_argument('-o', '--output', help="download directory (default: ./downloads)")
+    parser.add_argument('--library', help="folder that keeps one copy of every track (default: ./library)")
+    parser.add_argument('--link-mode', choices=('hardlink', 'symlink', 'copy', 'm3u'),
+                        help="how the download directory gets its files from the library (default: hardlink)")
+    parser.add_argument('--format', choices=('mp3', 'opus', 'm4a', 'native'),
+                        help="audio format of the library files; native keeps YouTube's stream without re-encoding (default: mp3)")
+    parser.add_argument('--bitrate', help="bitrate when encoding to mp3, opus or m4a (default: 192k)")
+    parser.add_argument('--refresh', action='append', default=[], metavar='TRACK',
+                        help="forget a Spotify track's YouTube match and downloaded file so it is fetched again (repeatable)")
+    parser.add_argument('--dry-run', action='store_true', help="list the tracks that would be downloaded and exit")
+    parser.add_argument('--no-lyrics', action='store_true', help="skip Genius lyrics")
+    parser.add_argument('--no-lrc', action='store_true', help="do not write .lrc files")
+    parser.add_argument('--full', action='store_true', help="process every track instead of syncing only new ones")
+    parser.add_argument('--prune', action='store_true', help="delete files for tracks removed from a playlist")
+    parser.add_argument('--report', help="write the JSON run report here (default: .spotitube_report.json in the download directory)")
+    parser.add_argument('--metrics-file', help="keep a Prometheus text-format metrics file updated during the run")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    links = read_playlist_links(args)
+    if not links and not args.refresh:
+        print("No playlist URLs given.", file=sys.stderr)
+        return 2
+
+    # Imported here so --help never pays for the core's dependencies
+    import os
+    from core import DownloaderCore, CONFIG_FILE
+
+    core = DownloaderCore(log=print)
+    if not core.load_config():
+        print(f"Spotify API keys are missing. Add them to the [API_KEYS] section of {CONFIG_FILE}.", file=sys.stderr)
+        return 2
+    if args.output:
+        core.download_dir = os.path.abspath(args.output)
+    if args.library:
+        core.library_dir = os.path.abspath(args.library)
+    if args.link_mode:
+        core.link_mode = args.link_mode
+    if args.format:
+        core.output_format = args.format
+    if args.bitrate:
+        core.output_bitrate = args.bitrate
+    core.lyrics_enabled = not args.no_lyrics
+    core.lrc_enabled = not args.no_lrc
+    core.sync_enabled = not args.full
+    core.prune_enabled = args.prune
+    if args.report:
+        core.report_file = args.report
+    if args.metrics_file:
+        core.metrics_file = args.metrics_file
+    core.initialize_apis()
+
+    failed = 0
+    for track in args.refresh:
+        try:
+            core.refresh_track(track)
+        except Exception as e:
+            print(f"[FAILED] {e}", file=sys.stderr)
+            failed += 1
+    for link in links:
+        print(f"=== {link}")
+        if args.dry_run:
+            try:
+                for track in core.get_tracks_for_run(link, prune=False):
+                    print(f"{track['artist']} - {track['name']}")
+            except Exception as e:
+                print(f"[FAILED] {e}", file=sys.stderr)
+                failed += 1
+            continue
+        core.run(link)
+        stats = core.throughput()
+        print(f"Processed {core.downloaded_tracks}/{core.total_tracks} tracks, {core.failed_tracks} failed "
+              f"({stats['tracks_per_min']:.1f} tracks/min, {stats['mb_per_sec']:.2f} MB/s).")
+        failed += core.failed_tracks
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
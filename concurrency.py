@@ -0,0 +1,58 @@
+import threading
+import time
+
+
+class AdaptiveConcurrency:
+    """Caps how many downloads run at once and tunes the cap from observed throughput and error rate.
+
+    Workers call acquire() before a download and release(nbytes, ok) after it. Every `window`
+    completions the cap is adjusted: halved if too many downloads failed, raised by one while
+    aggregate throughput keeps improving, and lowered by one once adding slots makes it worse.
+    With minimum == maximum the cap is fixed.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=16, window=8, max_error_rate=0.25):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.active = 0
+        self.cond = threading.Condition()
+        self.last_throughput = None
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window_start = time.monotonic()
+        self.window_bytes = 0
+        self.window_count = 0
+        self.window_errors = 0
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit:
+                self.cond.wait()
+            self.active += 1
+
+    def release(self, nbytes=0, ok=True):
+        with self.cond:
+            self.active -= 1
+            self.window_bytes += nbytes
+            self.window_count += 1
+            if not ok:
+                self.window_errors += 1
+            if self.window_count >= self.window:
+                self._adjust()
+            self.cond.notify_all()
+
+    def _adjust(self):
+        elapsed = max(time.monotonic() - self.window_start, 1e-6)
+        throughput = self.window_bytes / elapsed
+        if self.window_errors / self.window_count > self.max_error_rate:
+            self.limit = max(self.minimum, self.limit // 2)
+        elif self.last_throughput is None or throughput > self.last_throughput * 1.1:
+            self.limit = min(self.maximum, self.limit + 1)
+        elif throughput < self.last_throughput * 0.9:
+            self.limit = max(self.minimum, self.limit - 1)
+        self.last_throughput = throughput
+        self._reset_window()
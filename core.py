@@ -0,0 +1,1132 @@
+import os
+import sys
+import re
+import time
+import threading
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import configparser
+import subprocess
+
+from cache import ResolutionCache, LyricsCache, parse_duration
+from manifest import SyncManifest
+from concurrency import AdaptiveConcurrency
+from ratelimit import RateLimiter
+from metrics import Metrics
+from ranking import best_candidate, duration_matches, max_duration_for
+from library import TrackStore, LINK_MODES
+from journal import JobJournal, JOURNAL_FILENAME
+
+# spotipy, yt_dlp, youtube_search, lyricsgenius and mutagen are slow to import, so they are
+# imported where they are first needed. This keeps the CLI's --help and dry runs fast.
+
+# --- NEW: Helper function to find FFMPEG (Cross-Platform) ---
+def get_ffmpeg_path():
+    """Gets the correct path to ffmpeg, whether running as a script or a bundled exe."""
+    # Determine the executable filename based on the OS
+    ffmpeg_filename = "ffmpeg.exe" if sys.platform == "win32" else "ffmpeg"
+
+    if getattr(sys, 'frozen', False):
+        # We are running in a bundle (pyinstaller)
+        # The ffmpeg folder is at the root of the bundle
+        return os.path.join(sys._MEIPASS, 'ffmpeg', ffmpeg_filename)
+    else:
+        # We are running in a normal Python environment
+        # This assumes 'ffmpeg' is in the system's PATH
+        return "ffmpeg"
+
+FFMPEG_EXE_PATH = get_ffmpeg_path()
+# --- End of new code ---
+
+# --- PERFORMANCE CONFIGURATION ---
+# Downloads are network-bound and tuned at run time between MIN and MAX, starting at DOWNLOAD_WORKERS.
+# Transcoding is CPU-bound, so it gets one worker per core.
+DOWNLOAD_WORKERS = 4
+MIN_DOWNLOAD_WORKERS = 1
+MAX_DOWNLOAD_WORKERS = 16
+TRANSCODE_WORKERS = os.cpu_count() or 2
+FRAGMENT_DOWNLOADS = 1
+SEARCH_WORKERS = 8
+PAGE_WORKERS = 8
+# How many search results are ranked per track, and the largest download yt-dlp may start
+SEARCH_CANDIDATES = 5
+MAX_FILESIZE_MB = 50
+# Only the track attributes the pipeline uses, to keep Spotify pages small
+PLAYLIST_FIELDS = 'total,items(track(id,name,duration_ms,external_ids(isrc),artists(name),album(name)))'
+# Sustained requests per second for each service, and how hard to retry when throttled
+SPOTIFY_RATE = 10
+YOUTUBE_RATE = 5
+GENIUS_RATE = 4
+MAX_RETRIES = 4
+RETRY_PASSES = 1
+CONFIG_FILE = 'config.ini'
+CACHE_FILE = 'cache.sqlite3'
+STAGING_DIRNAME = '.spotitube-staging'
+# Partial downloads are kept this long so an interrupted run can resume them with range requests
+STALE_STAGING_DAYS = 7
+# Left behind in the download folder by interrupted runs (and by versions that embedded lyrics via temp files,
+# or had yt-dlp download straight into the folder: its partial files and the streams it had yet to convert)
+TEMP_SUFFIXES = ('.temp.mp3', '.lyrics.txt', '.mp3.tmp', '.opus.tmp', '.m4a.tmp', '.ogg.tmp', '.lrc.tmp', '.json.tmp',
+                 '.part', '.ytdl', '.webm')
+# Library file format: re-encoded to mp3, opus or m4a at OUTPUT_BITRATE, or 'native' to keep YouTube's
+# stream as it is and only remux it into the matching container
+OUTPUT_FORMAT = 'mp3'
+OUTPUT_BITRATE = '192k'
+OUTPUT_FORMATS = {'mp3': ('.mp3',), 'opus': ('.opus',), 'm4a': ('.m4a',), 'native': ('.opus', '.m4a', '.ogg', '.mp3')}
+ENCODERS = {'.mp3': 'libmp3lame', '.opus': 'libopus', '.m4a': 'aac'}
+# Native mode: container for a stream's codec, or failing that for the downloaded file's extension
+NATIVE_CONTAINERS = {'opus': '.opus', 'mp4a': '.m4a', 'aac': '.m4a', 'vorbis': '.ogg', 'mp3': '.mp3'}
+SOURCE_CONTAINERS = {'.webm': '.opus', '.opus': '.opus', '.m4a': '.m4a', '.mp4': '.m4a', '.ogg': '.ogg', '.mp3': '.mp3'}
+# Every track is kept once in LIBRARY_DIR; playlist folders link to it (see library.LINK_MODES)
+LIBRARY_DIR = 'library'
+LINK_MODE = 'hardlink'
+REPORT_FILENAME = '.spotitube_report.json'
+# Metrics stage that a retry of each rate-limited service is counted against
+RETRY_STAGES = {'spotify': 'spotify', 'youtube': 'search', 'genius': 'lyrics'}
+CACHE_TTL_DAYS = 30
+CACHE_MAX_ENTRIES = 50000
+LYRICS_WORKERS = 4
+LYRICS_TTL_DAYS = 90
+LYRICS_NEGATIVE_TTL_DAYS = 3
+
+class DownloaderCore:
+    """The fetch -> resolve -> download -> lyrics pipeline, shared by the GUI and the command line.
+
+    Progress is reported through two callbacks so no UI toolkit is needed here:
+    log(message) for status lines and on_progress() whenever the counters change.
+    """
+    def __init__(self, log=print, on_progress=None):
+        self.log = log
+        self.on_progress = on_progress or (lambda: None)
+
+        self.sp = None
+        self.genius = None
+        self.spotify_client_id = None
+        self.spotify_client_secret = None
+        self.genius_api_token = None
+        self.search_workers = SEARCH_WORKERS
+        self.search_candidates = SEARCH_CANDIDATES
+        self.max_filesize_mb = MAX_FILESIZE_MB
+        self.download_workers = DOWNLOAD_WORKERS
+        self.min_download_workers = MIN_DOWNLOAD_WORKERS
+        self.max_download_workers = MAX_DOWNLOAD_WORKERS
+        self.transcode_workers = TRANSCODE_WORKERS
+        self.fragment_downloads = FRAGMENT_DOWNLOADS
+        self.spotify_rate = SPOTIFY_RATE
+        self.youtube_rate = YOUTUBE_RATE
+        self.genius_rate = GENIUS_RATE
+        self.max_retries = MAX_RETRIES
+        self.retry_passes = RETRY_PASSES
+        self.report_file = None
+        self.metrics_file = None
+        self.cache_ttl_days = CACHE_TTL_DAYS
+        self.cache_max_entries = CACHE_MAX_ENTRIES
+        self.use_resolution_cache = True
+        self.lyrics_workers = LYRICS_WORKERS
+        self.lyrics_ttl_days = LYRICS_TTL_DAYS
+        self.lyrics_negative_ttl_days = LYRICS_NEGATIVE_TTL_DAYS
+
+        self.lyrics_enabled = True
+        self.lrc_enabled = True
+        self.sync_enabled = True
+        self.prune_enabled = False
+        self.library_dir = os.path.abspath(LIBRARY_DIR)
+        self.link_mode = LINK_MODE
+        self.output_format = OUTPUT_FORMAT
+        self.output_bitrate = OUTPUT_BITRATE
+
+        self.load_settings()
+        self.resolution_cache = ResolutionCache(CACHE_FILE, ttl_seconds=self.cache_ttl_days * 24 * 3600, max_entries=self.cache_max_entries)
+        self.lyrics_cache = LyricsCache(CACHE_FILE, ttl_seconds=self.lyrics_ttl_days * 24 * 3600, negative_ttl_seconds=self.lyrics_negative_ttl_days * 24 * 3600)
+        self.lyrics_pool = None
+        self.lyrics_futures = {}
+        self.lyrics_lock = threading.Lock()
+        self.search_session = None
+        self.session_lock = threading.Lock()
+        # Swappable so the offline benchmark can search a local stand-in instead of YouTube
+        self.search_backend = self.youtube_search
+
+        self.metrics = Metrics()
+        self.limiter = RateLimiter({'spotify': self.spotify_rate, 'youtube': self.youtube_rate, 'genius': self.genius_rate}, max_retries=self.max_retries,
+                                   on_retry=lambda service: self.metrics.add_retry(RETRY_STAGES[service]))
+        self.download_limiter = AdaptiveConcurrency(self.download_workers, self.min_download_workers, self.max_download_workers)
+        self.download_queue = Queue()
+        self.transcode_queue = Queue()
+        self.finalise_queue = Queue()
+        self.active_downloaders = 0
+        self.active_transcoders = 0
+        self.threads = []
+        self.youtube_links = []
+        self.downloaded_tracks = 0
+        self.failed_tracks = 0
+        self.total_tracks = 0
+        self.download_lock = threading.Lock()
+        self.sync_state = None
+        self.store = None
+        self.journal = None
+        self.placed_tracks = []
+        # Tracks an interrupted run of the same job already finished, as (link, path)
+        self.resumed_tracks = []
+        self.lyrics_retry = []
+        self.lyrics_missing = 0
+        self.active_finalisers = 0
+        self.run_link = None
+        self.run_name = None
+        self.run_order = {}
+
+        self.download_dir = os.path.abspath("downloads")
+
+    def load_config(self):
+        if not os.path.exists(CONFIG_FILE):
+            return False
+        config = configparser.ConfigParser()
+        config.read(CONFIG_FILE)
+        try:
+            self.spotify_client_id = config.get('API_KEYS', 'spotify_client_id')
+            self.spotify_client_secret = config.get('API_KEYS', 'spotify_client_secret')
+            self.genius_api_token = config.get('API_KEYS', 'genius_api_token', fallback=None)
+            if not self.spotify_client_id or not self.spotify_client_secret:
+                return False
+            return True
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            return False
+
+    def load_settings(self):
+        config = configparser.ConfigParser()
+        config.read(CONFIG_FILE)
+        self.search_workers = max(1, config.getint('SETTINGS', 'search_workers', fallback=SEARCH_WORKERS))
+        self.search_candidates = max(1, config.getint('SETTINGS', 'search_candidates', fallback=SEARCH_CANDIDATES))
+        self.max_filesize_mb = config.getfloat('SETTINGS', 'max_filesize_mb', fallback=MAX_FILESIZE_MB)
+        # Setting download_workers pins the download pool to that size instead of tuning it
+        fixed_downloads = config.getint('SETTINGS', 'download_workers', fallback=0)
+        self.download_workers = fixed_downloads or DOWNLOAD_WORKERS
+        self.min_download_workers = max(1, fixed_downloads or config.getint('SETTINGS', 'min_download_workers', fallback=MIN_DOWNLOAD_WORKERS))
+        self.max_download_workers = max(self.min_download_workers, fixed_downloads or config.getint('SETTINGS', 'max_download_workers', fallback=MAX_DOWNLOAD_WORKERS))
+        self.transcode_workers = max(1, config.getint('SETTINGS', 'transcode_workers', fallback=TRANSCODE_WORKERS))
+        self.fragment_downloads = max(1, config.getint('SETTINGS', 'fragment_downloads', fallback=FRAGMENT_DOWNLOADS))
+        self.spotify_rate = max(0.0, config.getfloat('SETTINGS', 'spotify_rate', fallback=SPOTIFY_RATE))
+        self.youtube_rate = max(0.0, config.getfloat('SETTINGS', 'youtube_rate', fallback=YOUTUBE_RATE))
+        self.genius_rate = max(0.0, config.getfloat('SETTINGS', 'genius_rate', fallback=GENIUS_RATE))
+        self.max_retries = max(0, config.getint('SETTINGS', 'max_retries', fallback=MAX_RETRIES))
+        self.retry_passes = max(0, config.getint('SETTINGS', 'retry_passes', fallback=RETRY_PASSES))
+        self.report_file = config.get('SETTINGS', 'report_file', fallback=None) or None
+        self.metrics_file = config.get('SETTINGS', 'metrics_file', fallback=None) or None
+        self.cache_ttl_days = config.getfloat('SETTINGS', 'cache_ttl_days', fallback=CACHE_TTL_DAYS)
+        self.cache_max_entries = config.getint('SETTINGS', 'cache_max_entries', fallback=CACHE_MAX_ENTRIES)
+        self.use_resolution_cache = config.getboolean('SETTINGS', 'use_resolution_cache', fallback=True)
+        self.lyrics_workers = max(1, config.getint('SETTINGS', 'lyrics_workers', fallback=LYRICS_WORKERS))
+        self.lyrics_ttl_days = config.getfloat('SETTINGS', 'lyrics_ttl_days', fallback=LYRICS_TTL_DAYS)
+        self.lyrics_negative_ttl_days = config.getfloat('SETTINGS', 'lyrics_negative_ttl_days', fallback=LYRICS_NEGATIVE_TTL_DAYS)
+        self.library_dir = os.path.abspath(config.get('SETTINGS', 'library_dir', fallback=LIBRARY_DIR) or LIBRARY_DIR)
+        self.link_mode = config.get('SETTINGS', 'link_mode', fallback=LINK_MODE).strip().lower()
+        if self.link_mode not in LINK_MODES:
+            self.log(f"Unknown link_mode '{self.link_mode}' in {CONFIG_FILE}; using {LINK_MODE}.")
+            self.link_mode = LINK_MODE
+        self.output_format = config.get('SETTINGS', 'output_format', fallback=OUTPUT_FORMAT).strip().lower()
+        if self.output_format not in OUTPUT_FORMATS:
+            self.log(f"Unknown output_format '{self.output_format}' in {CONFIG_FILE}; using {OUTPUT_FORMAT}.")
+            self.output_format = OUTPUT_FORMAT
+        self.output_bitrate = config.get('SETTINGS', 'output_bitrate', fallback=OUTPUT_BITRATE).strip() or OUTPUT_BITRATE
+
+    def save_config(self):
+        config = configparser.ConfigParser()
+        config.read(CONFIG_FILE)
+        config['API_KEYS'] = {
+            'spotify_client_id': self.spotify_client_id,
+            'spotify_client_secret': self.spotify_client_secret,
+            'genius_api_token': self.genius_api_token or ''
+        }
+        with open(CONFIG_FILE, 'w') as configfile:
+            config.write(configfile)
+
+    def initialize_apis(self):
+        """Creates the API clients. Raises if Spotify cannot be set up; a Genius failure only disables lyrics."""
+        if not self.spotify_client_id or not self.spotify_client_secret:
+            raise RuntimeError("Spotify API keys are not configured.")
+        import spotipy
+        from spotipy.oauth2 import SpotifyClientCredentials
+        try:
+            self.sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=self.spotify_client_id, client_secret=self.spotify_client_secret))
+        except Exception:
+            self.sp = None
+            raise
+        self.genius = None
+        if self.genius_api_token:
+            try:
+                import lyricsgenius
+                from sessions import mount_pool
+                self.genius = lyricsgenius.Genius(self.genius_api_token, verbose=False, remove_section_headers=True)
+                # The client already keeps one session; size its pool so every lyrics worker can keep a connection
+                if getattr(self.genius, '_session', None) is not None:
+                    mount_pool(self.genius._session, self.lyrics_workers)
+            except Exception as e:
+                self.log(f"Failed to initialize Genius client. Lyrics will be unavailable. Error: {e}")
+
+    def sanitize_filename(self, name):
+        sanitized = re.sub(r'[\\/*?:"<>|]', '_', name)
+        return sanitized.strip()
+
+    def count_progress(self, failed=False):
+        with self.download_lock:
+            self.downloaded_tracks += 1
+            if failed:
+                self.failed_tracks += 1
+        self.metrics.track_done()
+        if self.metrics_file:
+            self.metrics.maybe_write_prometheus(self.metrics_file)
+        self.on_progress()
+
+    def throughput(self):
+        return self.metrics.throughput(self.downloaded_tracks, self.total_tracks)
+
+    def write_report(self):
+        """Writes the JSON run report (report_file, or a hidden file in the download folder)."""
+        try:
+            self.metrics.write_json(self.report_file or os.path.join(self.download_dir, REPORT_FILENAME), self.downloaded_tracks, self.total_tracks)
+            if self.metrics_file:
+                self.metrics.maybe_write_prometheus(self.metrics_file, interval=0)
+        except OSError as e:
+            self.log(f"Error writing run report: {e}")
+
+    def fetch_links(self, playlist_link, on_resolved=None):
+        """Resolves every track of a playlist and stores the links for a later start_download()."""
+        self.metrics.reset()
+        tracks, resumed = self.open_journal(self.get_tracks_for_run(playlist_link))
+        self.total_tracks = len(tracks) + len(resumed)
+        self.youtube_links = []
+        self.log(f"Found {self.total_tracks} tracks. Searching YouTube with {self.search_workers} workers...")
+        resolved = [None] * len(tracks)
+        for link in resumed:
+            self.prefetch_lyrics(link)
+        completed = len(resumed)
+        def on_track_resolved(index, link):
+            nonlocal completed
+            resolved[index] = link
+            self.record_resolution(tracks[index], link)
+            if link:
+                self.prefetch_lyrics(link)
+            completed += 1
+            if on_resolved:
+                on_resolved(completed)
+        self.resolve_tracks(tracks, on_track_resolved)
+        self.youtube_links = resumed + [link for link in resolved if link]
+        if self.sync_state and len(self.youtube_links) < self.total_tracks:
+            self.sync_state['incomplete'] = True
+        return self.youtube_links
+
+    def resolve_tracks(self, tracks, on_resolved):
+        """Searches YouTube for tracks on a bounded pool, calling on_resolved(index, link) as each search finishes.
+
+        Searches that still fail after the limiter's retries go to a retry queue that is worked through
+        again (up to retry_passes times) once the first pass is done, instead of being dropped.
+        """
+        pending = list(enumerate(tracks))
+        with ThreadPoolExecutor(max_workers=self.search_workers) as pool:
+            for attempt in range(self.retry_passes + 1):
+                if attempt:
+                    self.log(f"Retrying {len(pending)} failed searches...")
+                    time.sleep(self.limiter.base_delay * 2 ** attempt)
+                futures = {pool.submit(self.find_youtube_link, track, self.use_resolution_cache): (i, track) for i, track in pending}
+                retry_queue = []
+                for future in as_completed(futures):
+                    i, track = futures[future]
+                    try:
+                        link = future.result()
+                    except Exception as e:
+                        retry_queue.append((i, track))
+                        if attempt == self.retry_passes:
+                            self.log(f"Search error for '{track['name']} {track['artist']}': {str(e)}")
+                        continue
+                    on_resolved(i, link)
+                pending = retry_queue
+                if not pending:
+                    break
+        for i, track in pending:
+            on_resolved(i, None)
+
+    def start_download(self, playlist_link=None):
+        """Starts the download workers on the fetched links, or on a streaming search of playlist_link."""
+        os.makedirs(self.download_dir, exist_ok=True)
+        os.makedirs(self.library_dir, exist_ok=True)
+        self.store = TrackStore(self.library_dir, self.link_mode)
+        self.placed_tracks = []
+        self.clean_temp_files()
+        while not self.download_queue.empty():
+            self.download_queue.get()
+        self.downloaded_tracks = 0
+        self.failed_tracks = 0
+        self.total_tracks = len(self.youtube_links)
+        self.threads = []
+        self.active_downloaders = self.max_download_workers
+        self.active_transcoders = self.transcode_workers
+        self.active_finalisers = self.lyrics_workers
+        self.lyrics_retry = []
+        self.lyrics_missing = 0
+        # One thread per possible download slot; the limiter decides how many are active at a time
+        for i in range(self.max_download_workers):
+            thread = threading.Thread(target=self.download_worker, args=(i,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        for i in range(self.transcode_workers):
+            thread = threading.Thread(target=self.transcode_worker, args=(i,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        # Waiting on Genius is kept off the CPU-sized transcode pool, on a pool the size of the lyrics pool
+        for i in range(self.lyrics_workers):
+            thread = threading.Thread(target=self.finalise_worker, args=(i,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        if self.youtube_links:
+            for link in self.youtube_links:
+                self.prefetch_lyrics(link)
+                self.download_queue.put(link)
+            for _ in range(self.max_download_workers):
+                self.download_queue.put(None)
+        else:
+            # Nothing resolved yet: search and download as one streaming pipeline
+            self.metrics.reset()
+            self.log("Fetching track list from Spotify...")
+            threading.Thread(target=self.pipeline_worker, args=(playlist_link,), daemon=True).start()
+        return self.threads
+
+    def is_running(self):
+        return any(t.is_alive() for t in self.threads)
+
+    def wait(self):
+        for thread in self.threads:
+            thread.join()
+        self.finish_run()
+
+    def finish_run(self):
+        self.finish_sync()
+        self.write_playlist_file()
+        self.close_journal()
+        self.write_report()
+        with self.lyrics_lock:
+            pool, self.lyrics_pool = self.lyrics_pool, None
+            self.lyrics_futures = {}
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, playlist_link):
+        """Syncs one playlist end to end and blocks until it is done."""
+        self.youtube_links = []
+        self.start_download(playlist_link)
+        self.wait()
+
+    def pipeline_worker(self, playlist_link):
+        """Fetches and resolves a playlist, feeding each link into the download queue as soon as it is found."""
+        try:
+            tracks, resumed = self.open_journal(self.get_tracks_for_run(playlist_link))
+            self.total_tracks = len(tracks) + len(resumed)
+            self.log(f"Found {self.total_tracks} tracks. Searching and downloading...")
+            self.on_progress()
+            for link in resumed:
+                self.prefetch_lyrics(link)
+                self.download_queue.put(link)
+            def on_resolved(index, link):
+                self.record_resolution(tracks[index], link)
+                if link:
+                    self.prefetch_lyrics(link)
+                    self.download_queue.put(link)
+                else:
+                    self.count_progress(failed=True)
+            self.resolve_tracks(tracks, on_resolved)
+        except Exception as e:
+            with self.download_lock:
+                self.failed_tracks += 1
+            self.log(f"[FAILED] Could not fetch playlist - {str(e)}")
+        finally:
+            for _ in range(self.max_download_workers):
+                self.download_queue.put(None)
+
+    def open_journal(self, tracks):
+        """Opens the job journal and splits tracks into (still to search, links found by an interrupted run).
+
+        Tracks the journal has as finished are dropped; failed ones are searched again.
+        """
+        self.close_journal()
+        kind, spotify_id = self.parse_spotify_link(self.run_link)
+        os.makedirs(self.download_dir, exist_ok=True)
+        self.journal = JobJournal(os.path.join(self.download_dir, JOURNAL_FILENAME), f"{kind}:{spotify_id}")
+        self.resumed_tracks = []
+        entries = self.journal.entries()
+        if not entries:
+            return tracks, []
+        to_resolve, resumed, done = [], [], 0
+        for track in tracks:
+            entry = entries.get(self.journal.key(track))
+            if entry and entry['stage'] == 'tagged' and entry['error'] and entry['link']:
+                # Saved without lyrics because the lookup failed: only the lyrics are fetched again
+                resumed.append(dict(entry['link'], lyrics_pending=True))
+            elif entry and entry['stage'] == 'tagged':
+                done += 1
+                if entry['link'] and entry['path']:
+                    self.resumed_tracks.append((entry['link'], entry['path']))
+                    # The manifest is only saved every few seconds, so a crash can lose tracks the journal has
+                    if self.sync_state and os.path.exists(entry['path']):
+                        self.sync_state['manifest'].record(self.sync_state['playlist_id'], entry['link'], entry['path'])
+            elif entry and entry['stage'] != 'failed' and entry['link']:
+                resumed.append(entry['link'])
+            else:
+                to_resolve.append(track)
+        self.log(f"Resuming an interrupted run: {done} tracks already done, {len(resumed)} already found on YouTube.")
+        return to_resolve, resumed
+
+    def record_stage(self, item, stage, **details):
+        if self.journal:
+            try:
+                self.journal.mark(item, stage, **details)
+            except Exception as e:
+                self.log(f"Error writing job journal: {e}")
+
+    def record_resolution(self, track, link):
+        if link:
+            self.record_stage(link, 'resolved', link=link)
+        else:
+            self.record_stage(track, 'failed', error="no matching YouTube video")
+
+    def close_journal(self):
+        """Closes the journal, clearing it when the run finished without failures."""
+        journal, self.journal = self.journal, None
+        if not journal:
+            return
+        if self.failed_tracks == 0 and self.lyrics_missing == 0 and not (self.sync_state and self.sync_state.get('incomplete')):
+            journal.clear()
+        journal.close()
+
+    def clean_temp_files(self):
+        """Deletes temp files left by interrupted runs, and staged downloads too old to be worth resuming."""
+        removed = 0
+        if os.path.isdir(self.download_dir):
+            for name in os.listdir(self.download_dir):
+                path = os.path.join(self.download_dir, name)
+                if name.endswith(TEMP_SUFFIXES) or (name.endswith('.m4a') and self.is_unconverted_stream(path)):
+                    removed += self.remove_quietly(path)
+        # yt-dlp's .part files (and finished downloads not yet converted) are resumed by the journal, unless stale
+        staging = os.path.join(self.library_dir, STAGING_DIRNAME)
+        cutoff = time.time() - STALE_STAGING_DAYS * 24 * 3600
+        if os.path.isdir(staging):
+            for entry in os.scandir(staging):
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    removed += self.remove_quietly(entry.path)
+        if removed:
+            self.log(f"Removed {removed} leftover temporary files.")
+
+    def is_unconverted_stream(self, path):
+        """True for an .m4a yt-dlp downloaded but never converted: unlike finished m4a tracks it is not linked
+        from the library and has no title tag."""
+        if os.path.islink(path) or not os.path.isfile(path) or os.stat(path).st_nlink > 1:
+            return False
+        try:
+            from mutagen.mp4 import MP4
+            tags = MP4(path).tags
+        except ImportError:
+            return False
+        except Exception:
+            return True  # Cut off part way, as an interrupted download is
+        return not (tags and '\xa9nam' in tags)
+
+    def remove_quietly(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    def parse_spotify_link(self, link):
+        """Returns (kind, id) for a playlist, album or artist URL or URI."""
+        match = re.search(r'(playlist|album|artist)[/:]([a-zA-Z0-9]+)', link)
+        if not match:
+            raise ValueError("Invalid Spotify URL: expected a playlist, album or artist link")
+        return match.group(1), match.group(2)
+
+    def refresh_track(self, track_link):
+        """Forgets a track's YouTube match and deletes its library file and the download folder's copy of it, so
+        the next run searches and downloads it again. For a wrong match, which is otherwise reused until it expires."""
+        match = re.search(r'(?:track[/:])?([a-zA-Z0-9]{22})\b', track_link)
+        if not match:
+            raise ValueError("Invalid Spotify track: expected a track URL, URI or ID")
+        track = self.track_from_item(self.spotify_call(self.sp.track, match.group(1)))
+        link = {'track_id': track['id'], 'isrc': track['isrc'], 'artist': track['artist'], 'title': track['name']}
+        self.resolution_cache.invalidate(track['id'])
+        store = TrackStore(self.library_dir, self.link_mode)
+        removed = 0
+        for ext in dict.fromkeys(OUTPUT_FORMATS['native'] + ('.lrc',)):
+            for key in store.keys(link):
+                store_file = os.path.join(self.library_dir, key + ext)
+                if not os.path.exists(store_file):
+                    continue
+                # Hard links and copies in the download folder would otherwise keep the wrong audio
+                for placed in (self.output_path(link) + ext, f"{self.output_path(link)} [{key}]{ext}"):
+                    if os.path.lexists(placed) and store.same_file(store_file, placed):
+                        removed += self.remove_quietly(placed)
+                removed += self.remove_quietly(store_file)
+        manifest = SyncManifest(self.download_dir)
+        for path in manifest.forget(track['id']):
+            for stale in (path, os.path.splitext(path)[0] + '.lrc'):
+                removed += self.remove_quietly(stale)
+        self.log(f"Refreshing '{track['name']}' by {track['artist']}: removed {removed} files; it is searched again on the next run.")
+
+    def get_tracks_for_run(self, playlist_link, prune=None):
+        """Returns the tracks to process; in sync mode only those not already in the folder's manifest."""
+        self.sync_state = None
+        self.run_link = playlist_link
+        self.run_name = None
+        self.run_order = {}
+        kind, spotify_id = self.parse_spotify_link(playlist_link)
+        if not self.sync_enabled:
+            self.run_name = self.fetch_run_name(kind, spotify_id)
+            return self.remember_order(self.get_spotify_tracks(playlist_link))
+        manifest = SyncManifest(self.download_dir)
+        if kind == 'playlist':
+            playlist_id = spotify_id
+            # The name comes with the snapshot_id for free; the M3U is named after it
+            playlist = self.spotify_call(self.sp.playlist, playlist_id, fields='name,snapshot_id')
+            snapshot_id, self.run_name = playlist['snapshot_id'], playlist.get('name')
+        else:
+            self.run_name = self.fetch_run_name(kind, spotify_id)
+            # Albums and artists have no snapshot_id; they are always listed, but only new tracks are fetched
+            playlist_id, snapshot_id = f"{kind}:{spotify_id}", None
+        self.sync_state = {'manifest': manifest, 'playlist_id': playlist_id, 'snapshot_id': snapshot_id}
+        if snapshot_id and manifest.snapshot_id(playlist_id) == snapshot_id:
+            # Unchanged playlist: only re-download files that went missing locally
+            self.log("Playlist unchanged since last sync.")
+            return manifest.missing_tracks(playlist_id)
+        tracks = self.remember_order(self.get_spotify_tracks(playlist_link))
+        removed = manifest.removed_track_ids(playlist_id, [t['id'] for t in tracks])
+        if removed and (self.prune_enabled if prune is None else prune):
+            for track_id in removed:
+                # In m3u mode the recorded paths are library files that other playlists may list
+                manifest.prune(playlist_id, track_id, delete_files=self.link_mode != 'm3u')
+            self.log(f"Deleted {len(removed)} tracks removed from the playlist.")
+        pending = manifest.pending_tracks(playlist_id, tracks)
+        self.log(f"{len(tracks) - len(pending)} tracks already downloaded, {len(pending)} to sync.")
+        return pending
+
+    def fetch_run_name(self, kind, spotify_id):
+        """Looks up the playlist, album or artist name that names the M3U; only needed in m3u mode.
+
+        Done while the run starts, on the pipeline's thread, so finishing a run makes no network calls.
+        """
+        if self.link_mode != 'm3u':
+            return None
+        try:
+            if kind == 'playlist':
+                return self.spotify_call(self.sp.playlist, spotify_id, fields='name')['name']
+            return self.spotify_call(getattr(self.sp, kind), spotify_id)['name']
+        except Exception:
+            return None
+
+    def remember_order(self, tracks):
+        """Keeps the playlist order of the fetched tracks, so the M3U lists them as Spotify does."""
+        self.run_order = {t['id']: i for i, t in enumerate(tracks) if t.get('id')}
+        return tracks
+
+    def finish_sync(self):
+        """Saves the manifest, marking the synced snapshot as complete once every track in the run made it to disk."""
+        if self.sync_state:
+            self.sync_state['manifest'].flush()
+        if self.sync_state and self.failed_tracks == 0 and not self.sync_state.get('incomplete'):
+            self.sync_state['manifest'].set_snapshot_id(self.sync_state['playlist_id'], self.sync_state['snapshot_id'])
+
+    def write_playlist_file(self):
+        """In m3u mode, writes an M3U8 of the playlist's library files into the download folder.
+
+        When syncing it lists every track recorded in the manifest, otherwise the tracks of this run and
+        those an interrupted run of the same job had already finished.
+        """
+        finished = self.resumed_tracks + self.placed_tracks
+        if self.link_mode != 'm3u' or not self.run_link or not finished:
+            return
+        if self.sync_state:
+            entries = self.sync_state['manifest'].tracks(self.sync_state['playlist_id'])
+        else:
+            entries = [{'id': link.get('track_id'), 'name': link['title'], 'artist': link['artist'],
+                        'duration_ms': link.get('duration_ms'), 'path': path} for link, path in finished]
+        entries.sort(key=lambda e: self.run_order.get(e['id'], len(self.run_order)))
+        kind, spotify_id = self.parse_spotify_link(self.run_link)
+        name = self.run_name or f"{kind}-{spotify_id}"
+        lines = ['#EXTM3U']
+        for entry in entries:
+            seconds = round(entry['duration_ms'] / 1000) if entry.get('duration_ms') else -1
+            lines += [f"#EXTINF:{seconds},{entry['artist']} - {entry['name']}", entry['path']]
+        playlist_file = os.path.join(self.download_dir, f"{self.sanitize_filename(name)}.m3u8")
+        try:
+            with open(playlist_file, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            self.log(f"Wrote playlist {os.path.basename(playlist_file)} ({len(entries)} tracks).")
+        except OSError as e:
+            self.log(f"Error writing playlist file: {e}")
+
+    def get_spotify_tracks(self, link):
+        kind, spotify_id = self.parse_spotify_link(link)
+        if kind == 'album':
+            return self.get_album_tracks(spotify_id)
+        if kind == 'artist':
+            return self.get_artist_top_tracks(spotify_id)
+        return self.get_playlist_tracks(spotify_id)
+
+    def spotify_call(self, fn, *args, **kwargs):
+        with self.metrics.time('spotify'):
+            return self.limiter.call('spotify', fn, *args, **kwargs)
+
+    def fetch_pages(self, first_page, page_size, fetch_page):
+        """Returns the items of every page: the first one is given, the rest are fetched concurrently by offset."""
+        offsets = range(len(first_page['items']), first_page['total'], page_size)
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as pool:
+            pages = list(pool.map(fetch_page, offsets))
+        return first_page['items'] + [item for page in pages for item in page['items']]
+
+    def track_from_item(self, track, album_name=None):
+        return {'id': track.get('id'), 'name': track['name'], 'artist': track['artists'][0]['name'],
+                'album': album_name if album_name is not None else track['album']['name'],
+                'duration_ms': track.get('duration_ms'), 'isrc': (track.get('external_ids') or {}).get('isrc')}
+
+    def get_playlist_tracks(self, playlist_id):
+        def fetch_page(offset):
+            return self.spotify_call(self.sp.playlist_items, playlist_id, fields=PLAYLIST_FIELDS, limit=100, offset=offset, additional_types=('track',))
+        items = self.fetch_pages(fetch_page(0), 100, fetch_page)
+        return [self.track_from_item(item['track']) for item in items if item.get('track') and item['track'].get('name')]
+
+    def get_album_tracks(self, album_id):
+        album = self.spotify_call(self.sp.album, album_id)
+        def fetch_page(offset):
+            return self.spotify_call(self.sp.album_tracks, album_id, limit=50, offset=offset)
+        items = [track for track in self.fetch_pages(album['tracks'], 50, fetch_page) if track]
+        # Album listings leave out external_ids; the full track objects carry the ISRC the library is keyed by
+        ids = [track['id'] for track in items if track.get('id')]
+        def fetch_full(offset):
+            return self.spotify_call(self.sp.tracks, ids[offset:offset + 50])['tracks']
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as pool:
+            full = {track['id']: track for batch in pool.map(fetch_full, range(0, len(ids), 50)) for track in batch if track}
+        return [self.track_from_item(dict(track, external_ids=full.get(track.get('id'), {}).get('external_ids')), album['name'])
+                for track in items]
+
+    def get_artist_top_tracks(self, artist_id):
+        results = self.spotify_call(self.sp.artist_top_tracks, artist_id)
+        return [self.track_from_item(track) for track in results['tracks'] if track]
+
+    def get_search_session(self):
+        with self.session_lock:
+            if self.search_session is None:
+                from sessions import make_session
+                self.search_session = make_session(self.search_workers)
+            return self.search_session
+
+    def youtube_search(self, query, max_results):
+        """Default search backend: returns youtube_search result dicts, each with a full 'url' added."""
+        from sessions import PooledYoutubeSearch
+        results = PooledYoutubeSearch(query, self.get_search_session(), max_results=max_results).to_dict()
+        return [dict(result, url=f"https://youtube.com{result['url_suffix']}") for result in results]
+
+    def find_youtube_link(self, track, use_cache=True):
+        link = {'track_id': track.get('id'), 'title': track['name'], 'artist': track['artist'], 'album': track.get('album', ''),
+                'duration_ms': track.get('duration_ms'), 'isrc': track.get('isrc')}
+        if track.get('lyrics_pending'):
+            link['lyrics_pending'] = True
+        expected = track['duration_ms'] / 1000 if track.get('duration_ms') else None
+        if use_cache:
+            cached = self.resolution_cache.get(track.get('id'))
+            # Entries from before candidates were ranked may point at a wrong-length video
+            if cached and duration_matches(cached['duration'], expected):
+                return dict(link, youtube_url=cached['youtube_url'], duration=cached['duration'])
+        search_query = f"{track['name']} {track['artist']} audio"
+        # Errors propagate so resolve_tracks can put the track on its retry queue
+        with self.metrics.time('search'):
+            results = self.limiter.call('youtube', self.search_backend, search_query, self.search_candidates)
+        best = best_candidate(results or [], track)
+        if best:
+            duration = parse_duration(best.get('duration'))
+            self.resolution_cache.put(track.get('id'), best['url'], duration)
+            return dict(link, youtube_url=best['url'], duration=duration)
+        if results:
+            self.log(f"No result close enough to '{track['name']}' by {track['artist']}; skipped {len(results)} candidates.")
+        return None
+
+    def track_from_link(self, link):
+        """The Spotify track a link was resolved from, for searching it again."""
+        return {'id': link.get('track_id'), 'name': link['title'], 'artist': link['artist'], 'album': link.get('album', ''),
+                'duration_ms': link.get('duration_ms'), 'isrc': link.get('isrc'), 'lyrics_pending': link.get('lyrics_pending')}
+
+    def output_path(self, link):
+        return os.path.join(self.download_dir, f"{self.sanitize_filename(link['artist'])} - {self.sanitize_filename(link['title'])}")
+
+    def download_worker(self, worker_id):
+        """Network stage: fetches the best audio stream as-is and hands it to the transcode stage."""
+        import yt_dlp
+        # One long-lived YoutubeDL per worker keeps extractors initialised and HTTP connections open across
+        # tracks. The per-track staging name is passed in through extract_info's extra_info, so nothing in the
+        # options changes from track to track.
+        ydl_opts = {
+            # Passthrough can only keep streams it has a container for
+            'format': 'bestaudio[acodec=opus]/bestaudio[ext=m4a]/bestaudio/best' if self.output_format == 'native' else 'bestaudio/best',
+            'noplaylist': True,
+            # Staged per library key and video: two tracks that resolve to one video must not share a .part file,
+            # and a .part is only ever resumed from the same video
+            'outtmpl': os.path.join(self.library_dir, STAGING_DIRNAME, '%(spotitube_key)s-%(id)s.%(ext)s'),
+            'quiet': True,
+            'noprogress': True,
+            'no_warnings': True,
+            'ignoreerrors': False,
+            'overwrites': False,
+            # Keep .part files and continue them with range requests, also across runs
+            'continuedl': True,
+            'nopart': False,
+            'concurrent_fragment_downloads': self.fragment_downloads,
+            'max_filesize': int(self.max_filesize_mb * 1024 * 1024) if self.max_filesize_mb else None,
+        }
+        # The YoutubeDL is shared across tracks, so the per-track length limit is read from this holder
+        guard = {'max_duration': None}
+        def match_filter(info, *args, incomplete=False):
+            duration = info.get('duration')
+            if duration and guard['max_duration'] and duration > guard['max_duration']:
+                return f"video is {int(duration)}s long, expected at most {int(guard['max_duration'])}s"
+            if info.get('is_live'):
+                return "video is a live stream"
+            return None
+        ydl_opts['match_filter'] = match_filter
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                while True:
+                    link = self.download_queue.get()
+                    if link is None:
+                        self.download_queue.task_done()
+                        break
+                    # Only one worker at a time produces a given library file; a duplicate waits and is then linked
+                    self.store.claim(link)
+                    self.log(f"[Worker {worker_id}] Starting: {link['title']}")
+                    for attempt in range(self.retry_passes + 1):
+                        ok, error = False, None
+                        try:
+                            source, store_file, copy = self.fetch_source(ydl, guard, link)
+                            ok = True
+                        except Exception as e:
+                            error = e
+                        if ok:
+                            if source:
+                                self.transcode_queue.put((link, source, store_file, copy))
+                            else:
+                                # Already in the library: only needs linking into the folder
+                                self.finalise_queue.put((link, None, store_file))
+                            break
+                        # The cached video may have been removed; search again
+                        self.resolution_cache.invalidate(link.get('track_id'))
+                        if attempt == self.retry_passes:
+                            self.store.release(link)
+                            self.record_stage(link, 'failed', error=str(error))
+                            self.log(f"[FAILED] {link['title']} - {str(error)}")
+                            self.count_progress(failed=True)
+                            break
+                        self.log(f"[Worker {worker_id}] Retrying {link['title']} after error: {error}")
+                        self.metrics.add_retry('download')
+                        time.sleep(self.limiter.base_delay * 2 ** (attempt + 1))
+                        try:
+                            link = self.find_youtube_link(self.track_from_link(link), use_cache=False) or link
+                        except Exception:
+                            pass  # Search unavailable: try the same video again
+                    self.download_queue.task_done()
+        finally:
+            with self.download_lock:
+                self.active_downloaders -= 1
+                last = self.active_downloaders == 0
+            if last:
+                for _ in range(self.transcode_workers):
+                    self.transcode_queue.put(None)
+
+    def fetch_source(self, ydl, guard, link):
+        """Returns (source, store_file, copy) for a track. source is None when the track is already in the
+        library; otherwise it is a staged stream, downloaded now or left by an interrupted run.
+
+        Only a real download takes a download slot, so library hits do not read as falling throughput.
+        """
+        store_file = self.store.find(link, OUTPUT_FORMATS[self.output_format])
+        if not store_file and '.mp3' in OUTPUT_FORMATS[self.output_format] and self.store.adopt(self.store.path(link), f"{self.output_path(link)}.mp3"):
+            store_file = self.store.path(link)
+        if store_file:
+            return None, store_file, False
+        acodec = None
+        entry = self.journal.entry(link) if self.journal else None
+        if entry and entry['stage'] in ('downloaded', 'transcoded') and entry['path'] and os.path.exists(entry['path']):
+            # Finished by an interrupted run; pick up from the file it left in staging
+            source = entry['path']
+        else:
+            guard['max_duration'] = max_duration_for(link['duration_ms'] / 1000 if link.get('duration_ms') else None)
+            self.download_limiter.acquire()
+            ok, nbytes = False, 0
+            try:
+                with self.metrics.time('download'):
+                    info = ydl.extract_info(link['youtube_url'], download=True, extra_info={'spotitube_key': self.store.key(link)})
+                    if not info or not info.get('requested_downloads'):
+                        raise ValueError("rejected by the size/duration guard")
+                requested = (info.get('requested_downloads') or [{}])[0]
+                source = requested.get('filepath') or ydl.prepare_filename(info)
+                acodec = requested.get('acodec') or info.get('acodec')
+                nbytes = os.path.getsize(source)
+                ok = True
+            finally:
+                self.download_limiter.release(nbytes, ok)
+            self.metrics.add_bytes('download', nbytes)
+            self.record_stage(link, 'downloaded', path=source)
+        ext, copy = self.output_extension(source, acodec)
+        return source, self.store.path(link, ext), copy
+
+    def transcode_worker(self, worker_id):
+        """CPU stage: converts (or remuxes) a downloaded stream into staging and hands it to the finalise stage."""
+        try:
+            while True:
+                item = self.transcode_queue.get()
+                if item is None:
+                    break
+                link, source, store_file, copy = item
+                staged = os.path.join(self.library_dir, STAGING_DIRNAME, os.path.basename(store_file))
+                try:
+                    # A source that is already the staged file was converted by an interrupted run
+                    if source != staged:
+                        with self.metrics.time('transcode'):
+                            self.transcode(source, staged, copy)
+                        self.record_stage(link, 'transcoded', path=staged)
+                        self.log(f"[Transcoder {worker_id}] {'Remuxed' if copy else 'Converted'} to {os.path.splitext(staged)[1][1:]}: {link['artist']} - {link['title']}")
+                    self.finalise_queue.put((link, staged, store_file))
+                except Exception as e:
+                    self.record_stage(link, 'failed', error=str(e))
+                    self.log(f"[FAILED] {link['title']} - {str(e)}")
+                    self.store.release(link)
+                    self.count_progress(failed=True)
+        finally:
+            with self.download_lock:
+                self.active_transcoders -= 1
+                last = self.active_transcoders == 0
+            if last:
+                for _ in range(self.lyrics_workers):
+                    self.finalise_queue.put(None)
+
+    def finalise_worker(self, worker_id):
+        """Last stage: adds lyrics and tags to a converted file, moves it into the library and links it into the
+        download folder. A new library file is complete before it is moved in; one already there is only linked.
+        """
+        try:
+            while True:
+                item = self.finalise_queue.get()
+                if item is None:
+                    break
+                self.finalise_track(*item)
+        finally:
+            with self.download_lock:
+                self.active_finalisers -= 1
+                last = self.active_finalisers == 0
+            if last:
+                self.retry_lyrics()
+
+    def finalise_track(self, link, staged, store_file):
+        failed = False
+        try:
+            lyrics_failed = False
+            if staged:
+                try:
+                    lyrics = self.wait_for_lyrics(link)
+                except Exception:
+                    lyrics, lyrics_failed = None, True
+                if lyrics and self.lrc_enabled: self.create_lrc_file(f"{os.path.splitext(store_file)[0]}.lrc", link['artist'], link['title'], lyrics)
+                self.write_tags(staged, link, lyrics)
+                os.replace(staged, store_file)
+            path = self.store.place(store_file, self.output_path(link))
+            retry = lyrics_failed
+            if not staged and link.get('lyrics_pending'):
+                # Saved by an earlier run whose lyrics lookup failed; with lyrics off it stays flagged
+                if self.lyrics_enabled and self.genius:
+                    lyrics_failed = retry = not self.add_lyrics(link, store_file, path, prefetched=True)
+                else:
+                    lyrics_failed = True
+            with self.download_lock:
+                self.placed_tracks.append((link, path))
+                if retry:
+                    # Retried once the run is done, so a Genius outage does not hold up the pipeline
+                    self.lyrics_retry.append((link, store_file, path))
+            self.record_track(link, path, lyrics_failed)
+            self.log(f"[SUCCESS] {link['artist']} - {link['title']}{os.path.splitext(store_file)[1]}")
+        except Exception as e:
+            failed = True
+            self.record_stage(link, 'failed', error=str(e))
+            self.log(f"[FAILED] {link['title']} - {str(e)}")
+        finally:
+            self.store.release(link)
+            self.count_progress(failed)
+
+    def record_track(self, link, path, lyrics_failed=False):
+        """Records a finished track in the journal and the sync manifest; a failed lyrics lookup is kept so the
+        next run fetches the lyrics again."""
+        self.record_stage(link, 'tagged', path=path, error="lyrics lookup failed" if lyrics_failed else None)
+        sync_state = self.sync_state
+        if sync_state and os.path.exists(path):
+            sync_state['manifest'].record(sync_state['playlist_id'], link, path, lyrics_pending=lyrics_failed)
+
+    def add_lyrics(self, link, store_file, path, prefetched=False):
+        """Looks up lyrics for a track already in the library and retags it in place. False if the lookup failed."""
+        try:
+            lyrics = self.wait_for_lyrics(link) if prefetched else self.get_lyrics(link)
+        except Exception:
+            return False
+        if lyrics:
+            if self.lrc_enabled: self.create_lrc_file(f"{os.path.splitext(store_file)[0]}.lrc", link['artist'], link['title'], lyrics)
+            self.write_tags(store_file, link, lyrics)
+            self.store.refresh(store_file, path)
+        return True
+
+    def retry_lyrics(self):
+        """Retries, up to retry_passes times, the lyrics lookups that failed during the run. Tracks that still
+        have none stay flagged in the journal and manifest for the next run."""
+        pending = self.lyrics_retry
+        for attempt in range(1, self.retry_passes + 1):
+            if not pending:
+                break
+            self.log(f"Retrying lyrics for {len(pending)} tracks...")
+            time.sleep(self.limiter.base_delay * 2 ** attempt)
+            with ThreadPoolExecutor(max_workers=self.lyrics_workers) as pool:
+                results = list(pool.map(lambda item: self.add_lyrics(*item), pending))
+            for (link, store_file, path), ok in zip(pending, results):
+                if ok:
+                    self.record_track(link, path)
+            pending = [item for item, ok in zip(pending, results) if not ok]
+        self.lyrics_retry = []
+        self.lyrics_missing = len(pending)
+        for link, store_file, path in pending:
+            self.log(f"Saved '{link['title']}' without lyrics; they will be looked up again on the next run.")
+
+    def output_extension(self, source, acodec=None):
+        """Returns (extension, copy) for a downloaded stream: the configured format, re-encoded, or in native
+        mode the container that fits the stream so it can be copied as is."""
+        if self.output_format != 'native':
+            return OUTPUT_FORMATS[self.output_format][0], False
+        for codec, ext in NATIVE_CONTAINERS.items():
+            if acodec and acodec.lower().startswith(codec):
+                return ext, True
+        ext = SOURCE_CONTAINERS.get(os.path.splitext(source)[1].lower())
+        # Nothing to copy into: fall back to an MP3 encode
+        return (ext, True) if ext else ('.mp3', False)
+
+    def transcode(self, source, target, copy=False):
+        """Encodes source into target's format at output_bitrate, or with copy=True only remuxes the audio stream."""
+        codec = ['-codec:a', 'copy'] if copy else ['-codec:a', ENCODERS[os.path.splitext(target)[1]], '-b:a', self.output_bitrate]
+        cmd = [FFMPEG_EXE_PATH, '-y', '-loglevel', 'error', '-i', source, '-vn', *codec, target]
+        startupinfo = None
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        try:
+            subprocess.run(cmd, check=True, capture_output=True, startupinfo=startupinfo)
+        except Exception:
+            if os.path.exists(target):
+                os.remove(target)
+            raise
+        os.remove(source)
+
+    def lyrics_key(self, link):
+        if link.get('track_id'):
+            return link['track_id']
+        return f"{link['artist'].lower()}|{link['title'].lower()}"
+
+    def prefetch_lyrics(self, link):
+        """Starts the Genius lookup for a resolved track on the lyrics pool, once per track."""
+        if not (self.lyrics_enabled and self.genius):
+            return
+        key = self.lyrics_key(link)
+        with self.lyrics_lock:
+            if key in self.lyrics_futures:
+                return
+            if self.lyrics_pool is None:
+                self.lyrics_pool = ThreadPoolExecutor(max_workers=self.lyrics_workers)
+            self.lyrics_futures[key] = self.lyrics_pool.submit(self.get_lyrics, link)
+
+    def wait_for_lyrics(self, link):
+        """Returns the prefetched lyrics (None if there are none). Raises if the lookup failed."""
+        if not (self.lyrics_enabled and self.genius):
+            return None
+        with self.lyrics_lock:
+            future = self.lyrics_futures.get(self.lyrics_key(link))
+        return future.result() if future else self.get_lyrics(link)
+
+    def get_lyrics(self, link):
+        """Returns lyrics from the cache, asking Genius only on a miss. Lookup errors are logged and raised, not cached."""
+        key = self.lyrics_key(link)
+        found, lyrics = self.lyrics_cache.get(key)
+        if found:
+            return lyrics
+        try:
+            with self.metrics.time('lyrics'):
+                lyrics = self.fetch_lyrics(link['artist'], link['title'])
+        except Exception as e:
+            self.log(f"Lyrics lookup failed for '{link['title']}' by {link['artist']}: {e}")
+            raise
+        self.lyrics_cache.put(key, lyrics)
+        return lyrics
+
+    def fetch_lyrics(self, artist, title):
+        if not self.genius: return None
+        song = self.limiter.call('genius', self.genius.search_song, title, artist)
+        return song.lyrics if song else None
+
+    def create_lrc_file(self, lrc_filename, artist, title, lyrics):
+        if not lyrics: return
+        try:
+            lrc_content = f"[ar:{artist}]\n[ti:{title}]\n"
+            lyrics = re.sub(r'.*Lyrics', '', lyrics, 1)
+            lines = [line.strip() for line in lyrics.split('\n') if line.strip() and not line.strip().startswith('[')]
+            lrc_content += "\n".join(lines)
+            with open(lrc_filename, 'w', encoding='utf-8') as f: f.write(lrc_content)
+        except Exception as e: self.log(f"Error creating LRC: {e}")
+
+    def write_tags(self, audio_file, link, lyrics=None):
+        """Writes title, artist, album and lyrics straight into the file's own tags, in place: ID3 for MP3,
+        iTunes atoms for M4A and Vorbis comments for Opus/Ogg."""
+        try:
+            with self.metrics.time('tag'):
+                ext = os.path.splitext(audio_file)[1].lower()
+                if ext == '.m4a':
+                    self.write_mp4_tags(audio_file, link, lyrics)
+                elif ext in ('.opus', '.ogg'):
+                    self.write_vorbis_comments(audio_file, link, lyrics)
+                else:
+                    self.write_id3_tags(audio_file, link, lyrics)
+        except Exception as e: self.log(f"Error writing tags: {e}")
+
+    def write_id3_tags(self, mp3_file, link, lyrics):
+        from mutagen.id3 import ID3, ID3NoHeaderError, TIT2, TPE1, TALB, USLT
+        try:
+            tags = ID3(mp3_file)
+        except ID3NoHeaderError:
+            tags = ID3()
+        tags.setall('TIT2', [TIT2(encoding=3, text=link['title'])])
+        tags.setall('TPE1', [TPE1(encoding=3, text=link['artist'])])
+        if link.get('album'):
+            tags.setall('TALB', [TALB(encoding=3, text=link['album'])])
+        if lyrics:
+            tags.setall('USLT', [USLT(encoding=3, lang='eng', desc='', text=lyrics)])
+        # ID3v2.3 for the widest player support, as the old ffmpeg remux used
+        tags.save(mp3_file, v2_version=3)
+
+    def write_mp4_tags(self, m4a_file, link, lyrics):
+        from mutagen.mp4 import MP4
+        audio = MP4(m4a_file)
+        if audio.tags is None:
+            audio.add_tags()
+        audio['\xa9nam'] = [link['title']]
+        audio['\xa9ART'] = [link['artist']]
+        if link.get('album'):
+            audio['\xa9alb'] = [link['album']]
+        if lyrics:
+            audio['\xa9lyr'] = [lyrics]
+        audio.save()
+
+    def write_vorbis_comments(self, ogg_file, link, lyrics):
+        from mutagen.oggopus import OggOpus
+        from mutagen.oggvorbis import OggVorbis
+        audio = (OggOpus if ogg_file.lower().endswith('.opus') else OggVorbis)(ogg_file)
+        audio['title'] = link['title']
+        audio['artist'] = link['artist']
+        if link.get('album'):
+            audio['album'] = link['album']
+        if lyrics:
+            # LYRICS is the field players that read Vorbis comments look for
+            audio['lyrics'] = lyrics
+        audio.save()
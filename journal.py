@@ -0,0 +1,73 @@
+import json
+import sqlite3
+import threading
+import time
+
+JOURNAL_FILENAME = '.spotitube_journal.sqlite3'
+# A track moves through these in order; 'failed' can follow any of them
+STAGES = ('resolved', 'downloaded', 'transcoded', 'tagged', 'failed')
+
+
+class JobJournal:
+    """Records how far each track of one job (a playlist, album or artist) got, committed at every step.
+
+    A run that is closed or crashes part way leaves its journal behind, and the next run of the same job
+    picks each track up at the stage it reached. The journal is cleared once a run finishes without failures.
+    """
+
+    def __init__(self, path, job):
+        self.path = path
+        self.job = job
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            # WAL keeps a commit per step cheap and still survives the process dying
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "job TEXT NOT NULL, track TEXT NOT NULL, stage TEXT NOT NULL, link TEXT, path TEXT, error TEXT, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (job, track))"
+            )
+
+    def key(self, item):
+        """Journal key for a Spotify track dict or a resolved link dict."""
+        track_id = item.get('track_id') or item.get('id')
+        if track_id:
+            return track_id
+        return f"{item['artist']}|{item.get('title') or item.get('name')}".lower()
+
+    def entries(self):
+        """Returns {key: {'stage', 'link', 'path', 'error'}} for every track this job has touched."""
+        with self.lock:
+            rows = self.conn.execute("SELECT track, stage, link, path, error FROM journal WHERE job = ?", (self.job,)).fetchall()
+        return {track: {'stage': stage, 'link': json.loads(link) if link else None, 'path': path, 'error': error}
+                for track, stage, link, path, error in rows}
+
+    def entry(self, item):
+        with self.lock:
+            row = self.conn.execute("SELECT stage, link, path, error FROM journal WHERE job = ? AND track = ?",
+                                    (self.job, self.key(item))).fetchone()
+        if not row:
+            return None
+        return {'stage': row[0], 'link': json.loads(row[1]) if row[1] else None, 'path': row[2], 'error': row[3]}
+
+    def mark(self, item, stage, link=None, path=None, error=None):
+        """Moves a track to `stage`. The resolved link is kept from earlier stages unless a new one is given."""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown journal stage '{stage}'")
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO journal (job, track, stage, link, path, error, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (job, track) DO UPDATE SET stage = excluded.stage, link = COALESCE(excluded.link, link), "
+                "path = excluded.path, error = excluded.error, updated_at = excluded.updated_at",
+                (self.job, self.key(item), stage, json.dumps(link) if link else None, path, error, time.time()),
+            )
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM journal WHERE job = ?", (self.job,))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
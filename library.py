@@ -0,0 +1,151 @@
+import filecmp
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+
+# How playlist folders get their files: hard links into the library (falling back to a symlink, then a
+# copy, where the filesystem cannot link), symlinks, plain copies, or no files at all and an M3U8 playlist
+LINK_MODES = ('hardlink', 'symlink', 'copy', 'm3u')
+
+
+class TrackStore:
+    """Keeps one file per recording in the library folder, named by ISRC or Spotify track ID.
+
+    Playlist folders only hold links to these files, so a track shared by several playlists (or listed
+    under several Spotify IDs with one ISRC) is searched, downloaded and converted once.
+    """
+
+    def __init__(self, root, link_mode='hardlink'):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode '{link_mode}', expected one of {', '.join(LINK_MODES)}")
+        self.root = root
+        self.link_mode = link_mode
+        self.locks = {}
+        self.target_locks = {}
+        self.lock = threading.Lock()
+
+    def key(self, link):
+        return self.keys(link)[0]
+
+    def keys(self, link):
+        """Every name a track's library file may have, preferred first. The ISRC can be missing (album
+        listings, older manifests), so the file may also have been stored under the Spotify ID."""
+        keys = []
+        if link.get('isrc'):
+            keys.append(f"isrc-{link['isrc'].upper()}")
+        if link.get('track_id'):
+            keys.append(f"spotify-{link['track_id']}")
+        if not keys:
+            digest = hashlib.sha1(f"{link['artist'].lower()}|{link['title'].lower()}".encode('utf-8')).hexdigest()
+            keys.append(f"name-{digest[:16]}")
+        return keys
+
+    def path(self, link, ext='.mp3'):
+        return os.path.join(self.root, self.key(link) + ext)
+
+    def find(self, link, extensions):
+        """Returns the track's library file under any of its keys, in the first of `extensions` that exists, or None."""
+        for key in self.keys(link):
+            for ext in extensions:
+                path = os.path.join(self.root, key + ext)
+                if os.path.exists(path):
+                    return path
+        return None
+
+    def claim(self, link):
+        """Waits until no other worker is producing this track's library file. Pair with release()."""
+        with self.lock:
+            lock = self.locks.setdefault(self.key(link), threading.Lock())
+        lock.acquire()
+
+    def release(self, link):
+        with self.lock:
+            lock = self.locks.get(self.key(link))
+        if lock and lock.locked():
+            lock.release()
+
+    def adopt(self, store_file, existing):
+        """Moves an MP3 downloaded before the library existed into it, so it is linked instead of fetched again.
+
+        Only a plain file with no other links is taken: anything else already belongs to another track. In copy
+        mode place() copies it straight back; in m3u mode the folder's files are left alone.
+        """
+        if self.link_mode == 'm3u' or os.path.exists(store_file):
+            return False
+        if not os.path.isfile(existing) or os.path.islink(existing) or os.stat(existing).st_nlink > 1:
+            return False
+        # shutil.move copies when the library is on another drive; if even that fails the track is just downloaded
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            shutil.move(existing, store_file)
+        except OSError:
+            # Never leave a half-copied file behind that would pass for a finished one
+            if os.path.exists(existing) and os.path.exists(store_file):
+                os.remove(store_file)
+            return False
+        lrc = os.path.splitext(existing)[0] + '.lrc'
+        if os.path.isfile(lrc) and not os.path.islink(lrc):
+            try:
+                shutil.move(lrc, os.path.splitext(store_file)[0] + '.lrc')
+            except OSError:
+                pass  # The lyrics are written again when the track is next tagged
+        return True
+
+    def same_file(self, a, b):
+        try:
+            return os.path.samefile(a, b) or filecmp.cmp(a, b, shallow=False)
+        except OSError:
+            return False
+
+    def place(self, store_file, target_base):
+        """Makes a library file (and its .lrc) appear as target_base + its extension. Returns the path used.
+
+        If another track already has that name in the folder, the library key is appended rather than
+        overwriting it. In m3u mode nothing is placed and the library path itself is returned.
+        """
+        if self.link_mode == 'm3u':
+            return store_file
+        store_base, ext = os.path.splitext(store_file)
+        # Two different tracks can share a name, so the check and the link must not interleave with another placement
+        with self.lock:
+            lock = self.target_locks.setdefault(os.path.normcase(os.path.abspath(target_base)), threading.Lock())
+        with lock:
+            if os.path.lexists(target_base + ext) and not self.same_file(store_file, target_base + ext):
+                target_base = f"{target_base} [{os.path.basename(store_base)}]"
+            for source, target in ((store_file, target_base + ext), (store_base + '.lrc', target_base + '.lrc')):
+                if os.path.exists(source) and not (os.path.lexists(target) and self.same_file(source, target)):
+                    self.link(source, target)
+        return target_base + ext
+
+    def refresh(self, store_file, placed):
+        """Brings a placed track (and its .lrc) up to date after its library file was retagged. Hard links and
+        symlinks follow the library by themselves; copies are replaced."""
+        if self.link_mode == 'm3u' or placed == store_file:
+            return
+        pairs = ((store_file, placed), (os.path.splitext(store_file)[0] + '.lrc', os.path.splitext(placed)[0] + '.lrc'))
+        for source, target in pairs:
+            if os.path.exists(source) and not (os.path.lexists(target) and self.same_file(source, target)):
+                self.link(source, target)
+
+    def link(self, source, target):
+        # Built next to the target under a name of its own and renamed over it, so a stale file is replaced in one step
+        base, ext = os.path.splitext(target)
+        temp_path = f"{base}.{uuid.uuid4().hex[:8]}{ext}.tmp"
+        if self.link_mode == 'hardlink':
+            try:
+                os.link(source, temp_path)
+                os.replace(temp_path, target)
+                return
+            except OSError:
+                pass  # Different filesystem, or one without hard links
+        if self.link_mode in ('hardlink', 'symlink'):
+            try:
+                os.symlink(os.path.abspath(source), temp_path)
+                os.replace(temp_path, target)
+                return
+            except OSError:
+                pass  # e.g. Windows without the symlink privilege
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
@@ -1,51 +1,21 @@
-
-
 import os
 import sys
-import re
-import time
-import ssl
 import threading
-from queue import Queue
+import queue
 from tkinter import filedialog
-import configparser
-import traceback
 
 # Tkinter and Style
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import tkinter.font as tkfont
 
-# Spotify and YouTube Libraries
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-import yt_dlp
-from youtube_search import YoutubeSearch
+from core import DownloaderCore
 
-# Add lyrics support
-import lyricsgenius
-
-# --- NEW: Helper function to find FFMPEG (Cross-Platform) ---
-def get_ffmpeg_path():
-    """Gets the correct path to ffmpeg, whether running as a script or a bundled exe."""
-    # Determine the executable filename based on the OS
-    ffmpeg_filename = "ffmpeg.exe" if sys.platform == "win32" else "ffmpeg"
-    
-    if getattr(sys, 'frozen', False):
-        # We are running in a bundle (pyinstaller)
-        # The ffmpeg folder is at the root of the bundle
-        return os.path.join(sys._MEIPASS, 'ffmpeg', ffmpeg_filename)
-    else:
-        # We are running in a normal Python environment
-        # This assumes 'ffmpeg' is in the system's PATH
-        return "ffmpeg"
-
-FFMPEG_EXE_PATH = get_ffmpeg_path()
-# --- End of new code ---
-
-# --- PERFORMANCE CONFIGURATION ---
-NUM_WORKERS = 4
-CONFIG_FILE = 'config.ini'
+# Worker threads never touch Tk directly: they queue log lines and flag progress changes, and the UI
+# drains both once per frame. The log widget keeps only the newest lines; the full log goes to LOG_FILE.
+GUI_FRAME_MS = 100
+MAX_LOG_LINES = 1000
+LOG_FILE = 'spotitube.log'
 
 class DarkModeSpotifyDownloader:
     def __init__(self, root):
@@ -59,53 +29,56 @@ class DarkModeSpotifyDownloader:
         
         self.colors = {'background': '#1E1E1E', 'text': '#1DB954', 'accent': '#1DB954', 'input_bg': '#2C2C2C', 'button_bg': '#1DB954', 'button_fg': '#FFFFFF', 'progress_bg': '#3C3C3C'}
 
-        self.sp = None
-        self.genius = None
-        self.spotify_client_id = None
-        self.spotify_client_secret = None
-        self.genius_api_token = None
-
-        if not self.load_config():
+        self.events = queue.Queue()
+        self.pending_progress = None
+        self.fetch_completed = 0
+        self.log_file = open(LOG_FILE, 'a', encoding='utf-8')
+        self.core = DownloaderCore(log=self.log, on_progress=self.schedule_progress)
+        if not self.core.load_config():
             self.prompt_for_keys()
 
         self.initialize_apis()
 
-        self.download_queue = Queue()
         self.is_downloading = False
-        self.youtube_links = []
-        self.downloaded_tracks = 0
-        self.total_tracks = 0
-        self.download_lock = threading.Lock()
-
-        self.download_dir = os.path.abspath("downloads")
-        os.makedirs(self.download_dir, exist_ok=True)
+        os.makedirs(self.core.download_dir, exist_ok=True)
         
         self.create_dark_gui()
+        self.root.after(GUI_FRAME_MS, self.drain_events)
+
+    def log(self, message):
+        self.events.put(message)
+
+    def schedule_progress(self):
+        self.pending_progress = self.update_overall_progress
 
-    def load_config(self):
-        if not os.path.exists(CONFIG_FILE):
-            return False
-        config = configparser.ConfigParser()
-        config.read(CONFIG_FILE)
+    def drain_events(self):
+        lines = []
         try:
-            self.spotify_client_id = config.get('API_KEYS', 'spotify_client_id')
-            self.spotify_client_secret = config.get('API_KEYS', 'spotify_client_secret')
-            self.genius_api_token = config.get('API_KEYS', 'genius_api_token', fallback=None)
-            if not self.spotify_client_id or not self.spotify_client_secret:
-                return False
-            return True
-        except (configparser.NoSectionError, configparser.NoOptionError):
-            return False
+            while True:
+                lines.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        if lines:
+            self.append_log(lines)
+        progress, self.pending_progress = self.pending_progress, None
+        if progress:
+            progress()
+        self.root.after(GUI_FRAME_MS, self.drain_events)
 
-    def save_config(self):
-        config = configparser.ConfigParser()
-        config['API_KEYS'] = {
-            'spotify_client_id': self.spotify_client_id,
-            'spotify_client_secret': self.spotify_client_secret,
-            'genius_api_token': self.genius_api_token or ''
-        }
-        with open(CONFIG_FILE, 'w') as configfile:
-            config.write(configfile)
+    def append_log(self, lines):
+        """Inserts a batch of lines in one go, then trims the widget back to MAX_LOG_LINES."""
+        text = "\n".join(lines) + "\n"
+        self.log_file.write(text)
+        self.log_file.flush()
+        self.result_area.insert(tk.END, text)
+        line_count = int(self.result_area.index('end-1c').split('.')[0])
+        if line_count > MAX_LOG_LINES:
+            self.result_area.delete('1.0', f"{line_count - MAX_LOG_LINES + 1}.0")
+        self.result_area.see(tk.END)
+
+    def clear_log(self, title):
+        self.result_area.delete(1.0, tk.END)
+        self.log_file.write(f"\n=== {title} ===\n")
 
     def prompt_for_keys(self):
         dialog = tk.Toplevel(self.root)
@@ -121,17 +94,17 @@ class DarkModeSpotifyDownloader:
         tk.Label(frame, text="Spotify Client ID:", bg=self.colors['background'], fg=self.colors['text']).grid(row=0, column=0, sticky='w', pady=5)
         id_entry = tk.Entry(frame, width=40, bg=self.colors['input_bg'], fg=self.colors['text'])
         id_entry.grid(row=0, column=1, pady=5)
-        if self.spotify_client_id: id_entry.insert(0, self.spotify_client_id)
+        if self.core.spotify_client_id: id_entry.insert(0, self.core.spotify_client_id)
 
         tk.Label(frame, text="Spotify Client Secret:", bg=self.colors['background'], fg=self.colors['text']).grid(row=1, column=0, sticky='w', pady=5)
         secret_entry = tk.Entry(frame, width=40, bg=self.colors['input_bg'], fg=self.colors['text'])
         secret_entry.grid(row=1, column=1, pady=5)
-        if self.spotify_client_secret: secret_entry.insert(0, self.spotify_client_secret)
+        if self.core.spotify_client_secret: secret_entry.insert(0, self.core.spotify_client_secret)
 
         tk.Label(frame, text="Genius Token (Optional):", bg=self.colors['background'], fg=self.colors['text']).grid(row=2, column=0, sticky='w', pady=5)
         genius_entry = tk.Entry(frame, width=40, bg=self.colors['input_bg'], fg=self.colors['text'])
         genius_entry.grid(row=2, column=1, pady=5)
-        if self.genius_api_token: genius_entry.insert(0, self.genius_api_token)
+        if self.core.genius_api_token: genius_entry.insert(0, self.core.genius_api_token)
 
         def on_save():
             spotify_id = id_entry.get().strip()
@@ -139,10 +112,10 @@ class DarkModeSpotifyDownloader:
             if not spotify_id or not spotify_secret:
                 messagebox.showerror("Error", "Spotify Client ID and Secret are required.", parent=dialog)
                 return
-            self.spotify_client_id = spotify_id
-            self.spotify_client_secret = spotify_secret
-            self.genius_api_token = genius_entry.get().strip()
-            self.save_config()
+            self.core.spotify_client_id = spotify_id
+            self.core.spotify_client_secret = spotify_secret
+            self.core.genius_api_token = genius_entry.get().strip()
+            self.core.save_config()
             self.initialize_apis()
             dialog.destroy()
 
@@ -151,23 +124,13 @@ class DarkModeSpotifyDownloader:
         self.root.wait_window(dialog)
 
     def initialize_apis(self):
-        if not self.spotify_client_id or not self.spotify_client_secret:
+        if not self.core.spotify_client_id or not self.core.spotify_client_secret:
             messagebox.showerror("API Error", "Spotify API keys are not configured. The application will now exit.")
             sys.exit(1)
         try:
-            self.sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=self.spotify_client_id, client_secret=self.spotify_client_secret))
-            self.sp.search('test', limit=1)
+            self.core.initialize_apis()
         except Exception as e:
             messagebox.showerror("Spotify API Error", f"Failed to initialize Spotify client. Please check your keys in Settings.\n\nError: {e}")
-            self.sp = None
-        if self.genius_api_token:
-            try:
-                self.genius = lyricsgenius.Genius(self.genius_api_token, verbose=False, remove_section_headers=True)
-            except Exception as e:
-                messagebox.showwarning("Genius API Error", f"Failed to initialize Genius client. Lyrics will be unavailable.\n\nError: {e}")
-                self.genius = None
-        else:
-            self.genius = None
     
     def create_dark_gui(self):
         main_frame = tk.Frame(self.root, bg=self.colors['background'])
@@ -180,7 +143,7 @@ class DarkModeSpotifyDownloader:
         settings_button.pack(side=tk.RIGHT)
         url_frame = tk.Frame(main_frame, bg=self.colors['background'])
         url_frame.pack(fill=tk.X, pady=10)
-        url_label = tk.Label(url_frame, text="Spotify Playlist URL:", font=self.label_font, fg=self.colors['text'], bg=self.colors['background'])
+        url_label = tk.Label(url_frame, text="Spotify Playlist / Album / Artist URL:", font=self.label_font, fg=self.colors['text'], bg=self.colors['background'])
         url_label.pack(side=tk.LEFT, padx=(0, 10))
         self.url_entry = tk.Entry(url_frame, width=70, font=self.label_font, bg=self.colors['input_bg'], fg=self.colors['text'], insertbackground=self.colors['text'])
         self.url_entry.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 10))
@@ -203,7 +166,13 @@ class DarkModeSpotifyDownloader:
         self.lrc_var = tk.BooleanVar(value=True)
         lrc_check = tk.Checkbutton(lyrics_frame, text="Create .lrc files", variable=self.lrc_var, font=self.label_font, fg=self.colors['text'], bg=self.colors['background'], selectcolor=self.colors['input_bg'], activebackground=self.colors['background'], activeforeground=self.colors['text'])
         lrc_check.pack(side=tk.LEFT, padx=(20, 0))
-        self.dir_var.set(self.download_dir)
+        self.sync_var = tk.BooleanVar(value=True)
+        sync_check = tk.Checkbutton(lyrics_frame, text="Only sync new tracks", variable=self.sync_var, font=self.label_font, fg=self.colors['text'], bg=self.colors['background'], selectcolor=self.colors['input_bg'], activebackground=self.colors['background'], activeforeground=self.colors['text'])
+        sync_check.pack(side=tk.LEFT, padx=(20, 0))
+        self.prune_var = tk.BooleanVar(value=False)
+        prune_check = tk.Checkbutton(lyrics_frame, text="Delete removed tracks", variable=self.prune_var, font=self.label_font, fg=self.colors['text'], bg=self.colors['background'], selectcolor=self.colors['input_bg'], activebackground=self.colors['background'], activeforeground=self.colors['text'])
+        prune_check.pack(side=tk.LEFT, padx=(20, 0))
+        self.dir_var.set(self.core.download_dir)
         progress_container = tk.Frame(main_frame, bg=self.colors['background'])
         progress_container.pack(fill=tk.X, pady=10)
         overall_progress_frame = tk.Frame(progress_container, bg=self.colors['background'])
@@ -224,196 +193,103 @@ class DarkModeSpotifyDownloader:
         style.theme_use('default')
         style.configure("Custom.Horizontal.TProgressbar", background=self.colors['accent'], troughcolor=self.colors['progress_bg'])
 
-    def embed_lyrics_in_mp3(self, mp3_file, lyrics):
-        if not lyrics: return
-        try:
-            temp_lyrics_file = f"{mp3_file}.lyrics.txt"
-            with open(temp_lyrics_file, 'w', encoding='utf-8') as f: f.write(lyrics)
-            temp_output_file = f"{mp3_file}.temp.mp3"
-            
-            # --- MODIFIED: Use the FFMPEG_EXE_PATH variable ---
-            cmd = [FFMPEG_EXE_PATH, '-y', '-i', mp3_file, '-i', temp_lyrics_file, '-map', '0', '-map', '1', '-c', 'copy', '-id3v2_version', '3', '-metadata:s:t', 'mimetype=text/plain', temp_output_file]
-            
-            startupinfo = None
-            if os.name == 'nt':
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            import subprocess
-            subprocess.run(cmd, check=True, capture_output=True, startupinfo=startupinfo)
-            os.replace(temp_output_file, mp3_file)
-            os.remove(temp_lyrics_file)
-        except Exception as e: self.root.after(0, self.result_area.insert, tk.END, f"Error embedding lyrics: {e}\n")
-
-    # (All other functions remain the same)
     def select_directory(self):
         selected_dir = filedialog.askdirectory()
         if selected_dir:
-            self.download_dir = selected_dir
+            self.core.download_dir = selected_dir
             self.dir_var.set(selected_dir)
-            os.makedirs(self.download_dir, exist_ok=True)
-    def sanitize_filename(self, name):
-        sanitized = re.sub(r'[\\/*?:"<>|]', '_', name)
-        return sanitized.strip()
+            os.makedirs(self.core.download_dir, exist_ok=True)
+    def apply_options(self):
+        self.core.lyrics_enabled = self.lyrics_var.get()
+        self.core.lrc_enabled = self.lrc_var.get()
+        self.core.sync_enabled = self.sync_var.get()
+        self.core.prune_enabled = self.prune_var.get()
     def fetch_tracks_async(self):
-        if not self.sp:
+        if not self.core.sp:
             messagebox.showerror("API Error", "Spotify client not initialized. Please configure your API keys in Settings.")
             return
         playlist_link = self.url_entry.get()
         if not playlist_link:
-            messagebox.showerror("Error", "Please enter a Spotify playlist URL.")
+            messagebox.showerror("Error", "Please enter a Spotify playlist, album or artist URL.")
             return
+        self.apply_options()
         self.fetch_button.config(state=tk.DISABLED)
         self.download_button.config(state=tk.DISABLED)
-        self.result_area.delete(1.0, tk.END)
-        self.result_area.insert(tk.END, "Fetching track list from Spotify...\n")
+        self.clear_log(f"Fetch {playlist_link}")
+        self.log("Fetching track list from Spotify...")
         threading.Thread(target=self.fetch_tracks_worker, args=(playlist_link,), daemon=True).start()
     def fetch_tracks_worker(self, playlist_link):
         try:
-            tracks = self.get_spotify_playlist_tracks(playlist_link)
-            self.total_tracks = len(tracks)
-            self.youtube_links = []
-            self.root.after(0, self.result_area.insert, tk.END, f"Found {self.total_tracks} tracks. Searching YouTube (this may take a moment)...\n")
-            self.root.after(0, self.overall_progress_bar.config, {"maximum": self.total_tracks, "value": 0})
-            for i, track in enumerate(tracks):
-                youtube_link = self.find_youtube_link(track)
-                if youtube_link:
-                    self.youtube_links.append(youtube_link)
-                def update_fetch_progress(index):
-                    self.overall_progress_bar["value"] = index + 1
-                    percentage = ((index + 1) / self.total_tracks) * 100
-                    self.overall_percentage_label.config(text=f"{int(percentage)}%")
-                self.root.after(0, update_fetch_progress, i)
+            self.core.youtube_links = []
+            def on_resolved(completed):
+                self.fetch_completed = completed
+                self.pending_progress = self.update_fetch_progress
+            youtube_links = self.core.fetch_links(playlist_link, on_resolved)
+            self.log("\n--- Found YouTube Links ---")
+            for idx, link in enumerate(youtube_links, 1):
+                self.log(f"{idx}. {link['title']} by {link['artist']}")
             def on_fetch_complete():
-                self.result_area.insert(tk.END, "\n--- Found YouTube Links ---\n")
-                for idx, link in enumerate(self.youtube_links, 1):
-                    self.result_area.insert(tk.END, f"{idx}. {link['title']} by {link['artist']}\n")
-                messagebox.showinfo("Success", f"Ready to download {len(self.youtube_links)} tracks!")
+                messagebox.showinfo("Success", f"Ready to download {len(youtube_links)} tracks!")
                 self.fetch_button.config(state=tk.NORMAL)
                 self.download_button.config(state=tk.NORMAL)
             self.root.after(0, on_fetch_complete)
         except Exception as e:
+            # e is unbound once the except block ends, before Tk runs the callback
+            msg = str(e)
             def on_fetch_error():
-                messagebox.showerror("Error", str(e))
+                messagebox.showerror("Error", msg)
                 self.fetch_button.config(state=tk.NORMAL)
+                self.download_button.config(state=tk.NORMAL)
             self.root.after(0, on_fetch_error)
-    def get_spotify_playlist_tracks(self, playlist_link):
-        playlist_id_match = re.search(r'playlist/([a-zA-Z0-9]+)', playlist_link)
-        if not playlist_id_match:
-            raise ValueError("Invalid Spotify Playlist URL")
-        playlist_id = playlist_id_match.group(1)
-        results = self.sp.playlist_tracks(playlist_id)
-        tracks = []
-        while results:
-            tracks.extend([{'name': item['track']['name'], 'artist': item['track']['artists'][0]['name'], 'album': item['track']['album']['name']} for item in results['items'] if item['track']])
-            results = self.sp.next(results) if results['next'] else None
-        return tracks
-    def find_youtube_link(self, track):
-        search_query = f"{track['name']} {track['artist']} audio"
-        try:
-            results = YoutubeSearch(search_query, max_results=1).to_dict()
-            if results:
-                return {'title': track['name'], 'artist': track['artist'], 'album': track.get('album', ''), 'youtube_url': f"https://youtube.com{results[0]['url_suffix']}"}
-            return None
-        except Exception as e:
-            self.root.after(0, self.result_area.insert, tk.END, f"Search error for '{search_query}': {str(e)}\n")
-            return None
+    def update_fetch_progress(self):
+        completed = self.fetch_completed
+        self.overall_progress_bar.config(maximum=max(self.core.total_tracks, 1), value=completed)
+        if self.core.total_tracks > 0:
+            percentage = (completed / self.core.total_tracks) * 100
+            self.overall_percentage_label.config(text=f"{int(percentage)}%")
     def download_all_tracks(self):
-        if not self.youtube_links:
-            messagebox.showerror("Error", "Fetch tracks first!")
+        playlist_link = self.url_entry.get()
+        if not self.core.youtube_links and not playlist_link:
+            messagebox.showerror("Error", "Enter a Spotify playlist URL or fetch tracks first!")
+            return
+        if not self.core.youtube_links and not self.core.sp:
+            messagebox.showerror("API Error", "Spotify client not initialized. Please configure your API keys in Settings.")
             return
-        os.makedirs(self.download_dir, exist_ok=True)
-        while not self.download_queue.empty():
-            self.download_queue.get()
-        for link in self.youtube_links:
-            self.download_queue.put(link)
-        self.downloaded_tracks = 0
-        self.total_tracks = len(self.youtube_links)
-        self.overall_progress_bar.config(maximum=self.total_tracks, value=0)
+        self.apply_options()
+        self.overall_progress_bar.config(maximum=max(len(self.core.youtube_links), 1), value=0)
         self.overall_percentage_label.config(text="0%")
-        self.current_track_label.config(text=f"Starting {NUM_WORKERS} download workers...")
+        self.current_track_label.config(text=f"Starting {self.core.max_download_workers} download and {self.core.transcode_workers} transcode workers...")
         self.is_downloading = True
         self.fetch_button.config(state=tk.DISABLED)
         self.download_button.config(state=tk.DISABLED)
-        self.result_area.delete(1.0, tk.END)
-        self.threads = []
-        for i in range(NUM_WORKERS):
-            thread = threading.Thread(target=self.download_worker, args=(i,), daemon=True)
-            thread.start()
-            self.threads.append(thread)
+        self.clear_log(f"Download {playlist_link or 'fetched tracks'}")
+        self.core.start_download(playlist_link)
         self.monitor_download()
-    def download_worker(self, worker_id):
-        while not self.download_queue.empty():
-            try:
-                link = self.download_queue.get_nowait()
-            except Queue.Empty:
-                break
-            try:
-                self.root.after(0, self.result_area.insert, tk.END, f"[Worker {worker_id}] Starting: {link['title']}\n")
-                output_filename = os.path.join(self.download_dir, f"{self.sanitize_filename(link['artist'])} - {self.sanitize_filename(link['title'])}")
-                mp3_filename = f"{output_filename}.mp3"
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'noplaylist': True,
-                    'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}],
-                    'outtmpl': output_filename + '.%(ext)s',
-                    'quiet': True,
-                    'no_warnings': True,
-                    'ignoreerrors': False,
-                    'overwrites': False,
-                    'concurrent_fragment_downloads': NUM_WORKERS,
-                }
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([link['youtube_url']])
-                self.root.after(0, self.result_area.insert, tk.END, f"[Worker {worker_id}] Converted to MP3: {os.path.basename(mp3_filename)}\n")
-                if self.lyrics_var.get() and self.genius:
-                    lyrics = self.fetch_lyrics(link['artist'], link['title'])
-                    if lyrics:
-                        if self.lrc_var.get(): self.create_lrc_file(link['artist'], link['title'], lyrics)
-                        self.embed_lyrics_in_mp3(mp3_filename, lyrics)
-                self.root.after(0, self.result_area.insert, tk.END, f"[SUCCESS] {link['artist']} - {link['title']}.mp3\n")
-            except Exception as e:
-                self.root.after(0, self.result_area.insert, tk.END, f"[FAILED] {link['title']} - {str(e)}\n")
-            finally:
-                with self.download_lock:
-                    self.downloaded_tracks += 1
-                self.root.after(0, self.update_overall_progress)
-                self.download_queue.task_done()
-    def fetch_lyrics(self, artist, title):
-        if not self.genius: return None
-        try:
-            song = self.genius.search_song(title, artist)
-            return song.lyrics if song else None
-        except Exception: return None
-    def create_lrc_file(self, artist, title, lyrics):
-        if not lyrics: return
-        lrc_filename = os.path.join(self.download_dir, f"{self.sanitize_filename(artist)} - {self.sanitize_filename(title)}.lrc")
-        try:
-            lrc_content = f"[ar:{artist}]\n[ti:{title}]\n"
-            lyrics = re.sub(r'.*Lyrics', '', lyrics, 1)
-            lines = [line.strip() for line in lyrics.split('\n') if line.strip() and not line.strip().startswith('[')]
-            lrc_content += "\n".join(lines)
-            with open(lrc_filename, 'w', encoding='utf-8') as f: f.write(lrc_content)
-        except Exception as e: self.root.after(0, self.result_area.insert, tk.END, f"Error creating LRC: {e}\n")
     def update_overall_progress(self):
-        self.overall_progress_bar["value"] = self.downloaded_tracks
-        if self.total_tracks > 0:
-            percentage = (self.downloaded_tracks / self.total_tracks) * 100
+        core = self.core
+        self.overall_progress_bar.config(maximum=max(core.total_tracks, 1), value=core.downloaded_tracks)
+        if core.total_tracks > 0:
+            percentage = (core.downloaded_tracks / core.total_tracks) * 100
             self.overall_percentage_label.config(text=f"{int(percentage)}%")
-            self.current_track_label.config(text=f"Processed {self.downloaded_tracks} of {self.total_tracks} tracks...")
+            stats = core.throughput()
+            eta = stats['eta_seconds']
+            eta_text = f", ETA {int(eta // 60)}:{int(eta % 60):02d}" if eta is not None else ""
+            self.current_track_label.config(text=f"Processed {core.downloaded_tracks} of {core.total_tracks} tracks - {stats['tracks_per_min']:.1f} tracks/min, {stats['mb_per_sec']:.2f} MB/s{eta_text}")
     def monitor_download(self):
-        if any(t.is_alive() for t in self.threads):
+        if self.core.is_running():
             self.root.after(1000, self.monitor_download)
         else:
             self.is_downloading = False
+            self.core.finish_run()
             self.root.after(0, self.show_completion_message)
             self.root.after(0, self.enable_ui)
     def show_completion_message(self):
-        messagebox.showinfo("Complete", f"Download process finished. Processed {self.downloaded_tracks}/{self.total_tracks} files.")
+        messagebox.showinfo("Complete", f"Download process finished. Processed {self.core.downloaded_tracks}/{self.core.total_tracks} files.")
     def enable_ui(self):
         self.fetch_button.config(state=tk.NORMAL)
         self.download_button.config(state=tk.NORMAL)
-        self.overall_progress_bar["value"] = self.total_tracks
-        if self.total_tracks > 0: self.overall_percentage_label.config(text="100%")
+        self.overall_progress_bar["value"] = self.core.total_tracks
+        if self.core.total_tracks > 0: self.overall_percentage_label.config(text="100%")
         self.current_track_label.config(text="All downloads finished.")
         
 def main():
@@ -423,4 +299,4 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
+    main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+
+MANIFEST_FILENAME = '.spotitube_manifest.json'
+# Finished tracks are written out at most this often; flush() writes the rest when the run ends
+SAVE_INTERVAL = 5.0
+
+
+class SyncManifest:
+    """Records, per playlist, the last synced snapshot_id and the tracks already downloaded into a folder."""
+
+    def __init__(self, download_dir):
+        self.path = os.path.join(download_dir, MANIFEST_FILENAME)
+        self.lock = threading.Lock()
+        self.data = {'playlists': {}}
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                self.data = {'playlists': {}}
+
+    def _playlist(self, playlist_id):
+        return self.data['playlists'].setdefault(playlist_id, {'snapshot_id': None, 'tracks': {}})
+
+    def snapshot_id(self, playlist_id):
+        with self.lock:
+            return self._playlist(playlist_id)['snapshot_id']
+
+    def set_snapshot_id(self, playlist_id, snapshot_id):
+        with self.lock:
+            self._playlist(playlist_id)['snapshot_id'] = snapshot_id
+            self._save()
+
+    def _is_present(self, entry):
+        path = entry.get('path')
+        return bool(path) and os.path.exists(path) and os.path.getsize(path) == entry.get('size')
+
+    def pending_tracks(self, playlist_id, tracks):
+        """Returns the tracks that are not yet downloaded (or whose file has gone missing), and those saved
+        without lyrics because the lookup failed, flagged with lyrics_pending."""
+        with self.lock:
+            known = self._playlist(playlist_id)['tracks']
+            pending = []
+            for t in tracks:
+                entry = known.get(t.get('id'))
+                if entry and entry.get('lyrics_pending'):
+                    pending.append(dict(t, lyrics_pending=True))
+                elif not (entry and self._is_present(entry)):
+                    pending.append(t)
+            return pending
+
+    def missing_tracks(self, playlist_id):
+        """Returns recorded tracks whose file is no longer on disk or that still lack lyrics, rebuilt from the manifest alone."""
+        with self.lock:
+            known = self._playlist(playlist_id)['tracks']
+            return [{'id': tid, 'name': e['name'], 'artist': e['artist'], 'album': e.get('album', ''), 'duration_ms': e.get('duration_ms'),
+                     'isrc': e.get('isrc'), 'lyrics_pending': bool(e.get('lyrics_pending'))}
+                    for tid, e in known.items() if not self._is_present(e) or e.get('lyrics_pending')]
+
+    def tracks(self, playlist_id):
+        """Returns every recorded track of a playlist, in the order they were downloaded."""
+        with self.lock:
+            return [dict(e, id=tid) for tid, e in self._playlist(playlist_id)['tracks'].items()]
+
+    def removed_track_ids(self, playlist_id, current_ids):
+        current_ids = set(current_ids)
+        with self.lock:
+            return [tid for tid in self._playlist(playlist_id)['tracks'] if tid not in current_ids]
+
+    def record(self, playlist_id, track, path, lyrics_pending=False):
+        if not track.get('track_id'):
+            return
+        with self.lock:
+            self._playlist(playlist_id)['tracks'][track['track_id']] = {
+                'name': track['title'], 'artist': track['artist'], 'album': track.get('album', ''),
+                'duration_ms': track.get('duration_ms'), 'isrc': track.get('isrc'), 'path': path, 'size': os.path.getsize(path),
+                'lyrics_pending': lyrics_pending,
+            }
+            self.dirty = True
+            self._save_if_due()
+
+    def prune(self, playlist_id, track_id, delete_files=True):
+        """Forgets a track and deletes its downloaded files. Returns the deleted audio path, if any."""
+        with self.lock:
+            entry = self._playlist(playlist_id)['tracks'].pop(track_id, None)
+            self.dirty = True
+            self._save_if_due()
+            # Another playlist synced into the same folder may still want the file
+            shared = entry and any(e.get('path') == entry.get('path') for p in self.data['playlists'].values() for e in p['tracks'].values())
+        if not entry or not entry.get('path') or shared or not delete_files:
+            return None
+        base, _ = os.path.splitext(entry['path'])
+        for path in (entry['path'], base + '.lrc'):
+            if os.path.exists(path):
+                os.remove(path)
+        return entry['path']
+
+    def flush(self):
+        """Writes out any tracks recorded or pruned since the last save."""
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    def forget(self, track_id):
+        """Drops a track from every playlist, so the next sync downloads it again. Returns its recorded paths."""
+        with self.lock:
+            entries = []
+            for playlist in self.data['playlists'].values():
+                if track_id in playlist['tracks']:
+                    entries.append(playlist['tracks'].pop(track_id))
+                    # Otherwise an unchanged playlist is not listed again
+                    playlist['snapshot_id'] = None
+            if entries:
+                self._save()
+        return [e['path'] for e in entries if e.get('path')]
+
+    def _save_if_due(self):
+        # Rewriting the whole file for every track would cost more the longer the playlist gets
+        if time.monotonic() - self.saved_at >= SAVE_INTERVAL:
+            self._save()
+
+    def _save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+        self.saved_at = time.monotonic()
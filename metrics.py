@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class StageStats:
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.retries = 0
+        self.bytes = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds, ok=True):
+        self.count += 1
+        if not ok:
+            self.failures += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'failures': self.failures,
+            'retries': self.retries,
+            'bytes': self.bytes,
+            'total_seconds': round(self.total_seconds, 3),
+            'mean_seconds': round(self.total_seconds / self.count, 3) if self.count else 0.0,
+            'max_seconds': round(self.max_seconds, 3),
+            'histogram': {str(bound): n for bound, n in zip(LATENCY_BUCKETS + ('+Inf',), self.buckets)},
+        }
+
+
+class Metrics:
+    """Per-stage latency histograms and counters for one run, exportable as JSON or Prometheus text."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_export = 0.0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.stages = {}
+            self.tracks_done = 0
+
+    def _stage(self, stage):
+        return self.stages.setdefault(stage, StageStats())
+
+    @contextmanager
+    def time(self, stage):
+        """Times the enclosed block as one call of `stage`; an exception counts as a failure and is re-raised."""
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self._stage(stage).observe(elapsed, ok)
+
+    def add_bytes(self, stage, nbytes):
+        with self.lock:
+            self._stage(stage).bytes += nbytes
+
+    def add_retry(self, stage):
+        with self.lock:
+            self._stage(stage).retries += 1
+
+    def track_done(self):
+        with self.lock:
+            self.tracks_done += 1
+
+    def throughput(self, done, total):
+        """Returns tracks/min, MB/s and the estimated seconds left (None until something has finished)."""
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-6)
+            nbytes = sum(s.bytes for s in self.stages.values())
+        rate = done / elapsed
+        eta = (total - done) / rate if rate and total >= done else None
+        return {'tracks_per_min': rate * 60, 'mb_per_sec': nbytes / elapsed / 1e6, 'eta_seconds': eta}
+
+    def report(self, done=0, total=0):
+        with self.lock:
+            stages = {name: stats.to_dict() for name, stats in self.stages.items()}
+            started = self.started
+        return {
+            'started': started,
+            'elapsed_seconds': round(time.time() - started, 3),
+            'tracks_done': done,
+            'tracks_total': total,
+            'throughput': self.throughput(done, total),
+            'stages': stages,
+        }
+
+    def write_json(self, path, done=0, total=0):
+        _atomic_write(path, json.dumps(self.report(done, total), indent=2))
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            stages = list(self.stages.items())
+            tracks_done = self.tracks_done
+        lines.append('# TYPE spotitube_tracks_done_total counter')
+        lines.append(f'spotitube_tracks_done_total {tracks_done}')
+        for metric in ('calls', 'failures', 'retries', 'bytes'):
+            lines.append(f'# TYPE spotitube_stage_{metric}_total counter')
+            for name, stats in stages:
+                value = stats.count if metric == 'calls' else getattr(stats, metric)
+                lines.append(f'spotitube_stage_{metric}_total{{stage="{name}"}} {value}')
+        lines.append('# TYPE spotitube_stage_seconds histogram')
+        for name, stats in stages:
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ('+Inf',), stats.buckets):
+                cumulative += n
+                lines.append(f'spotitube_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'spotitube_stage_seconds_sum{{stage="{name}"}} {stats.total_seconds:.6f}')
+            lines.append(f'spotitube_stage_seconds_count{{stage="{name}"}} {stats.count}')
+        return '\n'.join(lines) + '\n'
+
+    def maybe_write_prometheus(self, path, interval=5.0):
+        """Rewrites the Prometheus text file at most every `interval` seconds (for node_exporter's textfile collector)."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_export < interval:
+                return
+            self.last_export = now
+        _atomic_write(path, self.prometheus_text())
+
+
+def _atomic_write(path, text):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
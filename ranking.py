@@ -0,0 +1,76 @@
+import re
+from difflib import SequenceMatcher
+
+from cache import parse_duration
+
+# A candidate may be off the Spotify length by this many seconds, or this fraction of it, whichever is larger
+DURATION_TOLERANCE_SECONDS = 30
+DURATION_TOLERANCE_RATIO = 0.2
+# Without a Spotify length to compare against, nothing longer than this is taken
+MAX_UNKNOWN_DURATION_SECONDS = 15 * 60
+
+# Words that usually mean a different recording, unless the Spotify title has them too
+PENALTY_WORDS = ('live', 'cover', 'remix', 'karaoke', 'instrumental', 'hour', 'loop', 'full album',
+                 'sped up', 'slowed', 'reverb', 'nightcore', '8d', 'reaction', 'tutorial', 'concert')
+
+
+def normalize(text):
+    return re.sub(r'[^a-z0-9 ]+', ' ', (text or '').lower()).split()
+
+
+def max_duration_for(expected_seconds):
+    """Longest acceptable video for a track of `expected_seconds` (None if unknown)."""
+    if not expected_seconds:
+        return MAX_UNKNOWN_DURATION_SECONDS
+    return expected_seconds + max(DURATION_TOLERANCE_SECONDS, expected_seconds * DURATION_TOLERANCE_RATIO)
+
+
+def duration_matches(duration, expected_seconds):
+    if not expected_seconds:
+        return duration is None or duration <= MAX_UNKNOWN_DURATION_SECONDS
+    if duration is None:
+        return False
+    tolerance = max(DURATION_TOLERANCE_SECONDS, expected_seconds * DURATION_TOLERANCE_RATIO)
+    return abs(duration - expected_seconds) <= tolerance
+
+
+def score_candidate(candidate, track):
+    """Scores a search result against a Spotify track; None means the candidate is rejected outright."""
+    expected = track['duration_ms'] / 1000 if track.get('duration_ms') else None
+    duration = parse_duration(candidate.get('duration'))
+    if not duration_matches(duration, expected):
+        return None
+
+    title_words = normalize(candidate.get('title'))
+    wanted_words = normalize(f"{track['artist']} {track['name']}")
+    score = SequenceMatcher(None, ' '.join(wanted_words), ' '.join(title_words)).ratio()
+    name_words = set(normalize(track['name']))
+    if name_words and name_words <= set(title_words):
+        score += 0.5
+    if expected and duration is not None:
+        score += 1 - abs(duration - expected) / max(expected, 1)
+
+    channel = (candidate.get('channel') or '').lower()
+    artist = track['artist'].lower()
+    if channel.endswith(' - topic'):
+        score += 0.5
+    if artist and artist in channel:
+        score += 0.3
+    if 'vevo' in channel or 'official' in channel:
+        score += 0.2
+
+    title_text = ' '.join(title_words)
+    name_text = ' '.join(normalize(track['name']))
+    for word in PENALTY_WORDS:
+        if re.search(rf'\b{word}\b', title_text) and not re.search(rf'\b{word}\b', name_text):
+            score -= 0.6
+    return score
+
+
+def best_candidate(candidates, track):
+    """Returns the highest scoring acceptable candidate, or None if all of them were rejected."""
+    scored = [(score_candidate(c, track), c) for c in candidates]
+    scored = [(s, c) for s, c in scored if s is not None]
+    if not scored:
+        return None
+    return max(scored, key=lambda pair: pair[0])[1]
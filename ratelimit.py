@@ -0,0 +1,95 @@
+import random
+import re
+import threading
+import time
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average with bursts of up to `capacity`, shared by all threads.
+    A rate of 0 or less means no limit, though a pause() after a Retry-After is still honoured."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.rate <= 0:
+                    return
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stops handing out tokens for `seconds`, e.g. after the service sent Retry-After."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+def error_details(error):
+    """Returns (http_status, retry_after_seconds) for an exception from spotipy, requests or lyricsgenius."""
+    response = getattr(error, 'response', None)
+    status = getattr(error, 'http_status', None) or getattr(response, 'status_code', None)
+    headers = getattr(error, 'headers', None) or getattr(response, 'headers', None) or {}
+    retry_after = headers.get('Retry-After') if hasattr(headers, 'get') else None
+    if status is None:
+        # lyricsgenius only reports the status code and headers inside the message
+        match = re.search(r'status code: (\d{3})', str(error))
+        status = int(match.group(1)) if match else None
+        match = re.search(r"'Retry-After': '(\d+)'", str(error))
+        retry_after = match.group(1) if match else retry_after
+    try:
+        retry_after = float(retry_after) if retry_after is not None else None
+    except ValueError:
+        retry_after = None
+    return status, retry_after
+
+
+def is_retryable(error, status):
+    if status is not None:
+        return status == 429 or status >= 500
+    # Connection resets and timeouts (requests' exceptions are OSErrors too)
+    return isinstance(error, OSError)
+
+
+class RateLimiter:
+    """One token bucket per service, plus retries with exponential backoff and jitter for throttled calls."""
+
+    def __init__(self, rates, max_retries=4, base_delay=1.0, max_delay=60.0, on_retry=None):
+        self.buckets = {service: TokenBucket(rate) for service, rate in rates.items()}
+        self.on_retry = on_retry or (lambda service: None)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def call(self, service, fn, *args, **kwargs):
+        bucket = self.buckets[service]
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                status, retry_after = error_details(e)
+                if attempt == self.max_retries or not is_retryable(e, status):
+                    raise
+                if retry_after is not None:
+                    delay = min(retry_after, self.max_delay)
+                    bucket.pause(delay)
+                else:
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                self.on_retry(service)
+                time.sleep(delay)
@@ -0,0 +1,41 @@
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from youtube_search import YoutubeSearch
+
+
+def make_session(pool_size):
+    """Returns a keep-alive session whose connection pool fits `pool_size` concurrent threads."""
+    session = requests.Session()
+    mount_pool(session, pool_size)
+    return session
+
+
+def mount_pool(session, pool_size):
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(pool_size, 1))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+class PooledYoutubeSearch(YoutubeSearch):
+    """YoutubeSearch that reuses a shared session instead of opening a new connection per query."""
+
+    def __init__(self, search_terms, session, **kwargs):
+        self.session = session
+        super().__init__(search_terms, **kwargs)
+
+    def _search(self):
+        url = f"https://youtube.com/results?search_query={urllib.parse.quote_plus(self.search_terms)}"
+        response = ""
+        for _ in range(self.retries + 1):
+            reply = self.session.get(url, proxies=self.proxy or None, timeout=self.timeout)
+            # Let throttling (429) surface as an HTTPError so the rate limiter can back off
+            reply.raise_for_status()
+            response = reply.text
+            if "ytInitialData" in response:
+                break
+        results = self._parse_html(response)
+        if self.max_results is not None and len(results) > self.max_results:
+            return results[: self.max_results]
+        return results